@@ -0,0 +1,341 @@
+'''
+author: Damola Mabogunje
+contact: damola@mabogunje.net
+summary: This program times the hot paths of the games: playing hands,
+         drawing cards, learning, and generating a Blackjack policy.
+         Every benchmark is seeded, so runs of different versions are
+         played out the same way and may be compared.
+
+         Results are written as JSON of the form
+         {"benchmarks": {[name]: {"count", "unit", "seconds", "rate"}}, ...}
+'''
+
+import argparse, json, os, platform, sys, socket, tempfile, shutil, resource;
+import numpy;
+from timeit import default_timer as timer;
+
+from blackjack import *;
+from player import *;
+from deck import *;
+from events import Sink;
+from odds import DealerOdds;
+
+import Gambling;
+import Server;
+
+
+SEED = 2013;
+SAMPLES = 20000;
+THRESHOLD = 0.1; # Slowdown allowed before a benchmark is called a regression
+CONNECTIONS = 1200; # More than select() can watch
+DESCRIPTORS = 64; # File descriptors kept free of connections
+DEADLINE = 60; # Seconds a server is given to serve its connections
+
+def main():
+    parser = argparse.ArgumentParser(prog="Benchmark", description="%(prog)s times the games' hot paths\
+            and reports their rates as JSON.", epilog="This program was developed by Damola Mabogunje");
+
+    parser.add_argument('-b', '--benchmark', metavar='BENCHMARK', action='append', choices=sorted(BENCHMARKS.keys()),
+                        help='Benchmark to run (may be repeated). Must be one of [%%(choices)s]. \
+                              Runs them all by default, but for those only run when asked for (%s).' % ", ".join(OPTIONAL)
+                       );
+
+    parser.add_argument('-n', '--samples', metavar='SAMPLES', type=int, default=SAMPLES,
+                        help='Number of hands, draws or transitions timed by each benchmark.'
+                       );
+
+    parser.add_argument('-r', '--repeat', metavar='REPEAT', type=int, default=3,
+                        help='Times to run each benchmark. The fastest run is reported.'
+                       );
+
+    parser.add_argument('-s', '--seed', metavar='SEED', type=int, default=SEED,
+                        help='Seeds the decks and transitions used.'
+                       );
+
+    parser.add_argument('-o', '--output', metavar='OUTPUT',
+                        help='File to write the results to, instead of the console.'
+                       );
+
+    parser.add_argument('-c', '--compare', metavar='PREVIOUS',
+                        help='Results of a previous run to compare against. Exits with 1 on a regression.'
+                       );
+
+    parser.add_argument('-t', '--threshold', metavar='THRESHOLD', type=float, default=THRESHOLD,
+                        help='Slowdown (as a fraction) tolerated before a benchmark is a regression.'
+                       );
+
+    args = parser.parse_args();
+
+    results = run(args.benchmark or sorted(name for name in BENCHMARKS if name not in OPTIONAL), args.samples, args.repeat, args.seed);
+    report = json.dumps(results, indent=2, sort_keys=True);
+
+    if args.output:
+        with open(args.output, 'w') as out:
+            out.write(report + "\n");
+    else:
+        print report;
+
+    if args.compare:
+        with open(args.compare) as previous:
+            regressions = compare(json.load(previous), results, args.threshold);
+
+        sys.exit(1 if regressions else 0);
+
+def run(names, samples=SAMPLES, repeat=3, seed=SEED):
+    '''
+    Runs each benchmark `repeat` times and keeps its fastest run
+    '''
+
+    results = { 'python': platform.python_version(),
+                'numpy': numpy.__version__,
+                'samples': samples,
+                'seed': seed,
+                'benchmarks': dict()
+              };
+
+    for name in names:
+        timings = [BENCHMARKS[name](samples, seed) for i in range(repeat)];
+        count, unit, seconds = min(timings, key=lambda t: t[2]);
+
+        results['benchmarks'][name] = { 'count': count,
+                                        'unit': unit,
+                                        'seconds': seconds,
+                                        'rate': count / seconds if seconds else float('inf')
+                                      };
+
+    return results;
+
+def compare(previous, current, threshold=THRESHOLD):
+    '''
+    Prints the change in rate of every benchmark found in both results
+    and returns the names of those that slowed by more than threshold
+    '''
+
+    regressions = [];
+
+    print "\n%-24s %14s %14s %8s" % ("BENCHMARK", "BEFORE", "AFTER", "CHANGE");
+
+    for name, result in sorted(current['benchmarks'].items()):
+        if name not in previous['benchmarks']:
+            continue;
+
+        before, after = previous['benchmarks'][name]['rate'], result['rate'];
+        change = after / before - 1;
+        flag = "";
+
+        if change < -threshold:
+            regressions.append(name);
+            flag = " REGRESSION";
+
+        print "%-24s %14.1f %14.1f %+7.1f%%%s" % (name, before, after, change * 100, flag);
+
+    return regressions;
+
+'''
+Each benchmark is given the number of samples and a seed, and returns
+how many units of work it timed, the unit, and the seconds they took.
+Setting up is left out of the timings.
+'''
+
+def whitejack_play(samples, seed):
+    game = Whitejack(Sink(), Deck(seed));
+    dealer = Dealer('Dealer', policy=Dealer.POLICIES['DRAW_BELOW_FOUR'], goal=Whitejack.GOAL);
+    learner = Learner('Learner', goal=Whitejack.GOAL);
+
+    start = timer();
+    game.play_many(samples, dealer, learner);
+
+    return (samples, 'hands', timer() - start);
+
+def blackjack_play(samples, seed):
+    game = Blackjack(Sink(), FullDeck(seed));
+    dealer = Dealer('Dealer', policy=Dealer.POLICIES['DRAW_BELOW_SEVENTEEN'], goal=Blackjack.GOAL);
+    player = BlackjackPlayer('Player');
+
+    player.compile(dealer.policy, game.deck);
+
+    start = timer();
+    game.play_many(samples, dealer, player);
+
+    return (samples, 'hands', timer() - start);
+
+def deck_draw(samples, seed, deck=Deck):
+    deck = deck(seed);
+
+    start = timer();
+
+    for i in xrange(samples):
+        deck.draw(1);
+
+    return (samples, 'draws', timer() - start);
+
+def full_deck_draw(samples, seed):
+    return deck_draw(samples, seed, FullDeck);
+
+def learner_learn(samples, seed, online=False):
+    learner = Learner('Learner', online=online);
+    m = len(learner.states);
+
+    rng = numpy.random.RandomState(seed);
+    transitions = zip(rng.randint(0, m, samples).tolist(), rng.randint(0, m, samples).tolist(),
+                      rng.choice([None, Whitejack.WIN], samples).tolist());
+
+    start = timer();
+
+    for old, curr, result in transitions:
+        learner.learn(old, curr, result);
+
+    return (samples, 'transitions', timer() - start);
+
+def learner_learn_online(samples, seed):
+    return learner_learn(samples, seed, True);
+
+def learner_calculate_weights(samples, seed):
+    '''
+    Normalises a state's weights from its counts. calculate_weights normalises
+    the weights in place, so each state's are set back to its counts before
+    every call, and every call does the same work.
+    '''
+    learner = Learner('Learner');
+
+    counts = numpy.random.RandomState(seed).randint(0, 100, learner.counts.shape);
+    learner.merge(counts.sum(1), counts);
+    weights = counts.astype(float);
+
+    start = timer();
+
+    for i in xrange(samples):
+        state = i % len(learner.states);
+        learner.weights[state] = weights[state];
+        learner.calculate_weights(state);
+
+    return (samples, 'calculations', timer() - start);
+
+def gambling_sweep(samples, seed, solver=Gambling.SOLVERS[0]):
+    '''
+    Generates the whole Blackjack policy from scratch, without printing it
+    '''
+
+    DealerOdds.TABLES.clear();
+    Gambling.PLAYER.compiled = None;
+
+    stdout = sys.stdout;
+    sys.stdout = open(os.devnull, 'w');
+
+    try:
+        start = timer();
+        Gambling.run(solver);
+        seconds = timer() - start;
+    finally:
+        sys.stdout.close();
+        sys.stdout = stdout;
+
+    return (1, 'sweeps', seconds);
+
+def expectimax_sweep(samples, seed):
+    return gambling_sweep(samples, seed, 'expectimax');
+
+def server_connections(samples, seed, connections=CONNECTIONS):
+    '''
+    Seats CONNECTIONS remote players on a Server over a Unix socket, has each
+    make a move, and serves them until they have all left again.
+    Fails should any player not be served within the DEADLINE, or any table be left open.
+
+    Each connection takes two file descriptors (the client's and the server's),
+    so no more are opened than the process may hold.
+    '''
+
+    limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0];
+
+    if limit != resource.RLIM_INFINITY and 2 * connections > limit - DESCRIPTORS:
+        connections = max((limit - DESCRIPTORS) // 2, 1);
+        sys.stderr.write("server_connections: only %d connections fit in %d file descriptors\n" % (connections, limit));
+
+    directory = tempfile.mkdtemp();
+    server = Server.Server(seed=seed);
+    server.listen_on(os.path.join(directory, 'server.sock'));
+    clients = [];
+
+    try:
+        start = timer();
+
+        for i in range(connections):
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM);
+            client.connect(os.path.join(directory, 'server.sock'));
+            client.sendall("hit\n");
+            clients.append(client);
+
+            server.poll();
+
+        serve(server, lambda: len(server.tables) == connections, "seat every player");
+
+        for client in clients:
+            client.setblocking(0);
+
+        answers = dict((client, "") for client in clients);
+        waiting = list(clients);
+
+        def answered():
+            waiting[:] = [client for client in waiting if not received(client, answers)];
+            return not waiting;
+
+        serve(server, answered, "answer every player");
+
+        for client in clients:
+            client.close();
+
+        serve(server, lambda: not server.tables, "clear every table");
+
+        seconds = timer() - start;
+    finally:
+        server.shutdown();
+        shutil.rmtree(directory);
+
+    return (connections, 'connections', seconds);
+
+def serve(server, done, task):
+    '''
+    Serves until done() or, should the DEADLINE pass first, fails
+    '''
+
+    deadline = timer() + DEADLINE;
+
+    while not done():
+        if timer() > deadline:
+            raise RuntimeError("The server did not %s within %d seconds" % (task, DEADLINE));
+
+        server.poll(0.01);
+
+def received(client, answers):
+    '''
+    Whether a client has been sent its answer to a move (its second prompt)
+    '''
+
+    try:
+        answers[client] += client.recv(65536);
+    except socket.error:
+        pass;
+
+    return answers[client].count(Server.Session.PROMPT) >= 2;
+
+BENCHMARKS = { 'whitejack_play': whitejack_play,
+               'blackjack_play': blackjack_play,
+               'deck_draw': deck_draw,
+               'full_deck_draw': full_deck_draw,
+               'learner_learn': learner_learn,
+               'learner_learn_online': learner_learn_online,
+               'learner_calculate_weights': learner_calculate_weights,
+               'gambling_sweep': gambling_sweep,
+               'expectimax_sweep': expectimax_sweep,
+               'server_connections': server_connections
+             };
+
+'''
+Benchmarks that are also checks (e.g. that the server holds more connections than
+select() can watch), and need more of the machine than the rest, are only run by name
+'''
+OPTIONAL = ['server_connections'];
+
+
+if __name__ == "__main__":
+    main();
@@ -12,37 +12,208 @@ summary: This program pits a POMDP AI against a Blackjack dealer.
 '''
 
 import argparse, math;
+import numpy;
 from blackjack import *;
 from player import *;
 from deck import *;
+from strategy import Strategy;
+from belief import BeliefStrategy;
+from cache import Cache, DIRECTORY;
+from evaluation import Evaluation;
+from bankroll import *;
+import results;
 
 GAME = Blackjack();
 
-DEALER = Dealer('Dealer', 0.5);
+DEALER = Dealer('Dealer', 0.5, goal=Blackjack.GOAL);
 DEALER.policy = Dealer.POLICIES['DRAW_BELOW_SEVENTEEN'];
 
 PLAYER = BlackjackPlayer('Two Bit Hand');
 STATES = range(4, 22) + [12.5, 13.5, 14.5, 15.5, 16.5, 17.5, 18.5, 19.5, 20.5]; # Hard States + Soft States
 STATES.sort();
 
+SOLVERS = ['heuristic', 'expectimax', 'belief'];
+BETS = { 'flat': FlatBetting, 'kelly': KellyBetting, 'count': CountBetting };
+
 '''
 DEALER.cards = [Card.KING];
 PLAYER.cards = [17];
 move = PLAYER.play(GAME.deck, DEALER.policy, DEALER.upcard());
 '''
 
-for state in STATES:
-    PLAYER.cards = [state] # ::HACK:: Since player's state is a sum of his cards, we can jump to any state by inserting the desired sum in card list
-
-    for card in set(GAME.deck.cards):
-        DEALER.cards = [card];
-        move = PLAYER.play(GAME.deck, DEALER.policy, DEALER.upcard());
-        
-        if ceil(state) == state:
-            print "%d,%d: %s" % (state, DEALER.upcard(), Action.describe(move));
-        else:
-            print "S%d,%d: %s" % (state, DEALER.upcard(), Action.describe(move));
-        
-        if move is Action.HIT:
-            PLAYER.cards.pop();
+def main():
+    parser = argparse.ArgumentParser(prog="Gambling", description="%(prog)s generates a policy for a game of Blackjack\
+            against a dealer who hits until his hand is >= 17.", epilog="This program was developed by Damola Mabogunje");
+
+    parser.add_argument('-s', '--solver', metavar='SOLVER', choices=SOLVERS, default=SOLVERS[0],
+                        help='How to decide each move. Must be one of [%(choices)s]'
+                       );
+
+    parser.add_argument('-c', '--cache', metavar='DIRECTORY', nargs='?', const=DIRECTORY,
+                        help='Reuse the policy generated by an identical run, or cache the one generated. (default: %s)' % DIRECTORY
+                       );
+
+    parser.add_argument('-e', '--evaluate', metavar='POLICY_FILE',
+                        help='Instead of generating a policy, measure the expected return of the one in POLICY_FILE \
+                              (e.g. results/aim27_blackjack.txt).'
+                       );
+
+    parser.add_argument('-d', '--dealer', metavar='DEALER', choices=sorted(Dealer.POLICIES.keys()), default='DRAW_BELOW_SEVENTEEN',
+                        help='Dealer policy to evaluate against. Must be one of [%(choices)s]'
+                       );
+
+    parser.add_argument('-n', '--hands', metavar='HANDS', type=int, default=0,
+                        help='Number of hands to simulate when evaluating, besides computing the exact return.'
+                       );
+
+    parser.add_argument('-w', '--workers', metavar='WORKERS', type=int, default=1,
+                        help='Number of processes to split the simulated hands between.'
+                       );
+
+    parser.add_argument('--seed', metavar='SEED', type=int,
+                        help='Seeds the simulated hands, so an evaluation can be repeated.'
+                       );
+
+    parser.add_argument('--sessions', metavar='SESSIONS', type=int, default=0,
+                        help='Number of betting sessions to simulate when evaluating.'
+                       );
+
+    parser.add_argument('--bankroll', metavar='UNITS', type=float, default=100,
+                        help='Bankroll each session starts with, in table minimums.'
+                       );
+
+    parser.add_argument('--length', metavar='HANDS', type=int, default=1000,
+                        help='Number of hands in a session.'
+                       );
+
+    parser.add_argument('--bet', metavar='SCHEME', choices=sorted(BETS.keys()), default='flat',
+                        help='How each hand is bet on. Must be one of [%(choices)s]'
+                       );
+
+    parser.add_argument('--spread', metavar='SPREAD', type=int, default=8,
+                        help='Most units bet at a high count, when count betting.'
+                       );
+
+    parser.add_argument('--fraction', metavar='FRACTION', type=float, default=0.5,
+                        help='Fraction of the Kelly bet made, when kelly betting.'
+                       );
+
+    parser.add_argument('--shoe', metavar='DECKS', type=int, choices=Shoe.DECKS,
+                        help='Deal each session from a shoe of its own, of DECKS decks, instead of an infinite deck.'
+                       );
+
+    parser.add_argument('--hourly', metavar='HANDS', type=int, default=HOURLY,
+                        help='Hands played an hour.'
+                       );
+
+    args = parser.parse_args();
+
+    if args.evaluate:
+        evaluate(args.evaluate, Dealer.POLICIES[args.dealer], args.hands, args.workers, args.seed);
+
+        if args.sessions:
+            gamble(args.evaluate, Dealer.POLICIES[args.dealer], args.sessions, args.bankroll, args.length, args.bet,
+                   args.spread, args.fraction, args.shoe, args.hourly, args.workers, args.seed);
+    else:
+        run(args.solver, Cache(args.cache) if args.cache else None);
+
+def run(solver=SOLVERS[0], cache=None):
+    '''
+    Print the move to make in each state against each upcard.
+    The heuristic player rates his chances of not losing while the
+    expectimax and belief strategies maximise his expected winnings.
+    '''
+
+    config = ('gambling', solver, GAME.__class__.__name__, Cache.deck(GAME.deck), DEALER.policy, STATES);
+    policy = cache.load(config) if cache else None;
+
+    if policy is None:
+        policy = generate(solver, cache);
+
+        if cache:
+            cache.save(config, policy);
+
+    for i, state in enumerate(STATES):
+        for upcard, move in zip(policy['upcards'], policy['moves'][i]):
+            if ceil(state) == state:
+                print "%d,%d: %s" % (state, upcard, Action.describe(move));
+            else:
+                print "S%d,%d: %s" % (state, upcard, Action.describe(move));
+
+def evaluate(path, policy=DEALER.policy, hands=0, workers=1, seed=None):
+    '''
+    Print the expected return of the policy in a file against a dealer using policy,
+    exactly and (should any hands be given) as simulated, with its 95% confidence interval
+    '''
+
+    evaluation = Evaluation(results.parse(path).table, policy, GAME.deck, GAME.GOAL);
+
+    print "Expected return of %s against %s" % (path, policy);
+    print "Exact: %+.5f" % evaluation.exact();
+
+    if hands:
+        mean, interval = evaluation.monte_carlo(hands, workers, seed);
+        print "Simulated (%d hands): %+.5f +/- %.5f" % (hands, mean, interval);
+
+def gamble(path, policy=DEALER.policy, sessions=1000, bankroll=100, length=1000, bet='flat', spread=8, fraction=0.5,
+           decks=None, hourly=HOURLY, workers=1, seed=None):
+    '''
+    Print the risk of ruin, drawdowns and hourly winnings of sessions betting
+    on hands played by the policy in a file, against a dealer using policy
+    '''
+
+    table = results.parse(path).table;
+
+    if bet == 'kelly':
+        betting = KellyBetting(Session.edges(table, policy, GAME.GOAL, decks), fraction);
+    elif bet == 'count':
+        betting = CountBetting(spread);
+    else:
+        betting = FlatBetting();
+
+    outcome = Session(table, policy, betting, bankroll, length, GAME.GOAL).simulate(sessions, decks, seed=seed, workers=workers);
+    report = summary(outcome, bankroll, hourly);
+
+    print "\n%d sessions of %d hands from %s, betting %s with %g units" % (sessions, length, "a %d deck shoe" % decks if decks else "an infinite deck", betting, bankroll);
+    print "Risk of ruin: %.5f" % report['ruin'];
+    print "Drawdown (50th, 90th, 99th percentile): %g, %g, %g units" % tuple(report['drawdown'][q] for q in (50, 90, 99));
+    print "Hourly EV (%d hands): %+.5f +/- %.5f units" % (hourly, report['hourly'], 1.96 * report['hourly_error']);
+    print "Mean final bankroll: %.5f units" % report['bankroll'];
+
+def generate(solver=SOLVERS[0], cache=None):
+    '''
+    Decides the move to make in each state against each upcard,
+    and returns the upcards and moves (one row per state) as arrays.
+    The belief strategy keeps its values in the cache, if given.
+    '''
+
+    strategy = None;
+
+    if solver == 'expectimax':
+        strategy = Strategy(DEALER.policy, GAME.deck, GAME.GOAL);
+    elif solver == 'belief':
+        strategy = BeliefStrategy.get(DEALER.policy, GAME.deck, GAME.GOAL, cache);
+    upcards = list(set(GAME.deck.cards));
+    moves = numpy.zeros((len(STATES), len(upcards)), dtype=numpy.int8);
+
+    for i, state in enumerate(STATES):
+        PLAYER.cards = [state] # ::HACK:: Since player's state is a sum of his cards, we can jump to any state by inserting the desired sum in card list
+
+        for j, card in enumerate(upcards):
+            DEALER.cards = [card];
+
+            if strategy:
+                move = strategy.action(state, DEALER.upcard());
+            else:
+                move = PLAYER.play(GAME.deck, DEALER.policy, DEALER.upcard());
+
+            moves[i, j] = move;
+            
+            if move is Action.HIT and not strategy:
+                PLAYER.cards.pop();
+
+    return { 'upcards': numpy.array(upcards), 'moves': moves };
+
 
+if __name__ == "__main__":
+    main();
@@ -9,13 +9,22 @@ summary: This program allows the user to pit a Markov learning AI
 '''
 
 import argparse, math;
+import numpy;
+from multiprocessing import Pool;
 from blackjack import *;
 from player import *;
+from simulation import BatchGame;
+from events import Sink, SINKS;
+import profiling;
+from cache import Cache, DIRECTORY;
+from checkpoint import Checkpoint;
 
 
 GAMES = [Whitejack(), Greyjack()];
 ROBOTS = [Learner('Learner')];
 LEARNING_RATE = 0.5;
+CHECKPOINT_EVERY = 10**6;
+ROUND = 1000;
 
 def main():
     parser = argparse.ArgumentParser(prog="Whitejack", description="%(prog)s is a reinforcement learning program for a simplified version of blackjack.\
@@ -39,12 +48,78 @@ def main():
                         default=LEARNING_RATE,
                         help='Speed of learning. Must be a float between 0 and 1.'
                        );
+
+    parser.add_argument('-b', '--batch', action='store_true',
+                        help='Simulate the games of each state at once, without printing them.'
+                       );
+    
+    parser.add_argument('-u', '--online', action='store_true',
+                        help='Learn online: move probabilities towards each transition by the learning rate.'
+                       );
+
+    parser.add_argument('-w', '--workers', metavar='WORKERS', type=int, default=1,
+                        help='Number of processes to split the sample games between.'
+                       );
+
+    parser.add_argument('-s', '--seed', metavar='SEED', type=int,
+                        help='Seeds the decks, so runs can be repeated.'
+                       );
+    
+    parser.add_argument('-l', '--log', metavar='LOG', choices=sorted(SINKS.keys()), default='text',
+                        help='How games are logged. Must be one of [%(choices)s]'
+                       );
+
+    parser.add_argument('-f', '--log-file', metavar='LOG_FILE',
+                        help='File to log games to, instead of the console.'
+                       );
+
+    parser.add_argument('-p', '--profile', action='store_true',
+                        help='Time each phase of the games and print a summary at the end. Games played by workers are not timed.'
+                       );
+
+    parser.add_argument('-c', '--cache', metavar='DIRECTORY', nargs='?', const=DIRECTORY,
+                        help='Reuse what an identical run has learnt, or resume from a shorter one, and cache what is learnt. (default: %s)' % DIRECTORY
+                       );
+
+    parser.add_argument('-k', '--checkpoint', metavar='CHECKPOINT',
+                        help='File to save the progress of the run to, after every state and every EVERY games.'
+                       );
+
+    parser.add_argument('-e', '--every', metavar='EVERY', type=int, default=CHECKPOINT_EVERY,
+                        help='Number of games played between checkpoints. Batch and worker runs only save after every state.'
+                       );
+
+    parser.add_argument('--resume', action='store_true',
+                        help='Carry on from the last checkpoint. Needs the same arguments as the run that saved it.'
+                       );
+    
+    parser.add_argument('-a', '--tolerance', metavar='TOLERANCE', type=float,
+                        help='Sample adaptively: stop playing a state once the 95%% confidence intervals on its probabilities \
+                              are narrower than TOLERANCE, or SAMPLINGS games have been played.'
+                       );
+
+    parser.add_argument('--round', metavar='ROUND', type=int, default=ROUND,
+                        help='Number of games played between checks on the confidence intervals.'
+                       );
     
     args = parser.parse_args();
 
-    run(args.type, args.opponent, args.samplings, args.rate);
+    if args.resume and not args.checkpoint:
+        parser.error('--resume needs the --checkpoint to resume from');
 
-def run(game, opponent, samplings, learning_rate):
+    if args.profile:
+        profiling.enable();
+
+    run(args.type, args.opponent, args.samplings, args.rate, args.batch, args.workers, args.seed, 
+        Sink.open(args.log, args.log_file), args.online, Cache(args.cache) if args.cache else None,
+        Checkpoint(args.checkpoint, args.every) if args.checkpoint else None, args.resume, args.tolerance, args.round);
+
+    if args.profile:
+        print "\nProfile:";
+        print profiling.summary();
+
+def run(game, opponent, samplings, learning_rate, batch=False, workers=1, seed=None, sink=None, online=False, cache=None,
+        checkpoint=None, resume=False, tolerance=None, rounds=ROUND):
     
     if not game in range(len(GAMES)):
         prompt = "> Which Blackjack rules do you play by?";
@@ -66,16 +141,19 @@ def run(game, opponent, samplings, learning_rate):
         try:
             opponent = ROBOTS[input()] ;
             opponent.learning_rate = learning_rate;
-            opponent.samplings = samplings;
         except:
             opponent = Player(raw_input("Enter your name: "));
     else:
         opponent = ROBOTS[opponent];
+        opponent.learning_rate = learning_rate;
     
-    player = Dealer('Dealer', learning_rate);
-    player.policy = Dealer.POLICIES['DRAW_BELOW_FOUR'] if isinstance(game, Whitejack) else Dealer.POLICIES['DRAW_BELOW_THREE'];
+    policy = 'DRAW_BELOW_FOUR' if isinstance(game, Whitejack) else 'DRAW_BELOW_THREE';
+    player = Dealer('Dealer', learning_rate, online=online);
+    player.policy = Dealer.POLICIES[policy];
+    opponent.online = online;
 
     players = [player, opponent];
+    game.sink = sink or game.sink;
 
     print '''
           ============================
@@ -84,22 +162,106 @@ def run(game, opponent, samplings, learning_rate):
           '''
     trials = samplings;
 
-    for state in range(1,5):
-        games = [state]*trials;
-        
-        for hand in games:
-            game.play(players[0], players[1], hand);
+    '''
+    Start from what was learnt by the longest cached run like this one.
+    Should it have played as many games, there is nothing left to play.
+    '''
+    config = ('sampling', game.__class__.__name__, Cache.deck(game.deck), player.policy, 
+              seed, learning_rate, online, batch, workers, tolerance, rounds if tolerance else None);
+    cached = 0;
+
+    if cache:
+        cached, models = cache.latest(config, samplings);
+
+        if models:
+            restore(players, models, counted=cached < samplings);
+            print "Resuming from %d cached samplings" % cached;
+
+    trials = samplings - cached;
+
+    pool = Pool(workers) if workers > 1 and trials else None;
+    seeds = numpy.random.RandomState(seed if seed is None or not cached else [seed, cached]);
+
+    '''
+    A checkpoint holds what has been learnt, the state and number of games
+    into it that the run had reached, and the random number generators as
+    they were, so a resumed run plays exactly the games it would have.
+    '''
+    run_config = repr((config, samplings, cached));
+    first, done = 1, 0;
+    outcomes = numpy.zeros(3, dtype=numpy.int64);
+
+    if resume:
+        progress = checkpoint.load();
+
+        if progress is None:
+            print "No checkpoint at %s, starting afresh" % checkpoint.path;
+        elif progress['config'] != run_config:
+            raise ValueError('The checkpoint at %s is of a different run' % checkpoint.path);
+        else:
+            restore(players, progress['models']);
+            game.deck, seeds = progress['deck'], progress['seeds'];
+            first, done, outcomes = progress['state'], progress['done'], progress['outcomes'];
+
+            print "Resuming from state %d after %d games" % (first, done);
+
+    states = range(first, 5) if trials else [];
+
+    for state in states:
+        '''
+        Play the games for this state, saving our progress every so often.
+        A batch (or a pool of workers) plays its games all at once, as splitting 
+        them would change the decisions they are played with.
+
+        When sampling adaptively, games are played a round at a time until the
+        probabilities of the state are known to within the tolerance.
+        '''
+        if not done:
+            state_seed = None if seed is None or pool else seeds.randint(0, 2**31 - 1);
+            outcomes = numpy.zeros(3, dtype=numpy.int64);
+
+        every = checkpoint.every if checkpoint and checkpoint.every and not (batch or pool) else trials;
+        every = min(every, rounds) if tolerance else every;
+        converged = False;
+
+        while done < trials and not converged:
+            games = min(every, trials - done);
+
+            if pool:
+                tally = share(pool, workers, game, policy, players, state, games, seeds, batch, learning_rate, online);
+            else:
+                '''
+                A batch deals its games from a deck of its own, so every round
+                of one is seeded afresh (the deck of games played one at a time
+                carries on between rounds)
+                '''
+                round_seed = state_seed if not done else None;
 
-            '''
-            Start a new game of the same type
-            Clear player cards
-            Reverse play order
-            '''
+                if batch and done and seed is not None:
+                    round_seed = seeds.randint(0, 2**31 - 1);
 
-            game = Whitejack();
-            for p in players: del p.cards[:];
+                tally = play(game, players, state, games, batch, round_seed);
 
-            #players = [players[1], players[0]];
+            done += games;
+
+            if batch:
+                outcomes += tally;
+
+            converged = bool(tolerance) and uncertainty(players, state) < tolerance;
+
+            if checkpoint and done < trials and not converged:
+                checkpoint.save(config=run_config, models=dump(players), deck=game.deck, seeds=seeds,
+                                state=state, done=done, outcomes=outcomes);
+
+        if tolerance:
+            print "State %d: %s after %d games (interval %.4f)" % (state, "converged" if converged else "did not converge",
+                                                                   done, uncertainty(players, state));
+
+        done = 0;
+
+        if batch:
+            print "State %d: %s wins %d, %s wins %d, %d draws" % (state, players[0].name, outcomes[0],
+                                                                 players[1].name, outcomes[2], outcomes[1]);
             
         '''
         Get the probability of players transitioning to the next state
@@ -115,12 +277,24 @@ def run(game, opponent, samplings, learning_rate):
                 p.calculate_weights(5);
 
             p.calculate_weights(state);
+
+        if checkpoint:
+            checkpoint.save(config=run_config, models=dump(players), deck=game.deck, seeds=seeds,
+                            state=state + 1, done=0, outcomes=outcomes);
         
         print "\n";
+
+    if pool:
+        pool.close();
+
+    if cache and trials:
+        cache.save(config, dump(players), samplings);
+
+    game.sink.close();
     
     print "\nState probabilities:"
 
-    for hand, weight in sorted(player.weights.items(), key=lambda s: s[0]):
+    for hand, weight in enumerate(player.weights):
         '''
         Print probability matrix in decimal instead of fraction,
         while ignoring the last 2 entries 
@@ -129,6 +303,114 @@ def run(game, opponent, samplings, learning_rate):
         print "%s => %s" % (hand, map(float, weight));
 
 
+def share(pool, workers, game, policy, players, state, trials, seeds, batch=False, rate=LEARNING_RATE, online=False):
+    '''
+    Splits the games for a state between workers. Each plays its share
+    with its own seeded deck, starting from what has been learnt so far,
+    and we merge what they have learnt.
+    In batch, the number of losses, draws and wins is returned.
+    '''
+
+    shares = [trials // workers + (1 if i < trials % workers else 0) for i in range(workers)];
+    models = [(p.samples, p.counts, p.weights) for p in players];
+    tasks = [(game.__class__, policy, models, state, share, worker_seed, batch, rate, online) 
+             for share, worker_seed in zip(shares, seeds.randint(0, 2**31 - 1, workers))];
+
+    outcomes = numpy.zeros(3, dtype=numpy.int64);
+
+    for learnt, tally in pool.map(sample, tasks):
+        for p, (samples, counts) in zip(players, learnt):
+            p.merge(samples, counts);
+
+        if batch:
+            outcomes += tally;
+
+    return outcomes;
+
+def uncertainty(players, state):
+    '''
+    Returns the widest confidence interval on the probabilities
+    of the players transitioning from state. A player who has never
+    been seen in the state (e.g. a dealer who cannot win from it) has
+    nothing to estimate, but one of them must have been.
+    '''
+    widths = [p.intervals()[state].max() for p in players if p.samples[state]];
+
+    return max(widths) if widths else float('inf');
+
+def dump(players):
+    '''
+    Returns what the players have learnt as arrays, one row per player
+    '''
+    return { 'samples': numpy.array([p.samples for p in players]),
+             'counts': numpy.array([p.counts for p in players]),
+             'weights': numpy.array([p.weights for p in players])
+           };
+
+def restore(players, models, counted=False):
+    '''
+    Puts back what the players had learnt (See dump).
+
+    The weights of a finished run are probabilities, while learning (offline)
+    adds counts to them. So to learn on from a finished run (counted), offline
+    players take up their counts as their weights again.
+    '''
+
+    for i, p in enumerate(players):
+        p.samples, p.counts, p.weights = models['samples'][i].copy(), models['counts'][i].copy(), models['weights'][i].copy();
+
+        if counted and not p.online:
+            p.weights = p.counts.astype(float);
+
+        p.index();
+
+def play(game, players, state, trials, batch=False, seed=None):
+    '''
+    Plays `trials` games from the dealer's starting `state`.
+    In batch, the games are played all at once and the
+    number of losses, draws and wins is returned.
+    '''
+
+    if batch:
+        '''
+        The learner keeps the decisions it had when the games started
+        '''
+        tally = BatchGame(game, seed).play(trials, players[0], players[1], state);
+
+        for i, p in enumerate(players):
+            p.merge(tally.samples[i], tally.weights[i]);
+
+        return tally.outcomes;
+
+    if seed is not None:
+        game.deck.prepare(seed);
+
+    game.play_many(trials, players[0], players[1], state);
+
+def sample(task):
+    '''
+    Plays a share of the games for a state in a worker process.
+    The worker's players start from a copy of what has been learnt 
+    and return only what they learnt from their share.
+    Workers do not log their games.
+    '''
+
+    game, policy, models, state, trials, seed, batch, rate, online = task;
+
+    dealer = Dealer('Dealer', rate, online=online);
+    dealer.policy = Dealer.POLICIES[policy];
+    players = [dealer, Learner('Learner', rate, online=online)];
+
+    for p, (samples, counts, weights) in zip(players, models):
+        p.samples, p.counts, p.weights = samples.copy(), counts.copy(), weights;
+        p.index();
+
+    outcomes = play(game(Sink()), players, state, trials, batch, seed);
+
+    learnt = [(p.samples - samples, p.counts - counts) for p, (samples, counts, weights) in zip(players, models)];
+
+    return (learnt, outcomes);
+
 def run_interactive(game, player, opponent):
     '''
     Play a game of blackjack with a human opponent
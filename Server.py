@@ -0,0 +1,355 @@
+'''
+author: Damola Mabogunje
+contact: damola@mabogunje.net
+summary: This program hosts many tables of White, Grey or Blackjack at once,
+         in a single process. Each table pairs a dealer with a player who
+         connects over TCP (or a Unix socket), or with a bot.
+         Every dealer (and every bot) learns into one shared model,
+         which is printed when the server stops.
+
+         Players send a line per move ("hit" or "hold") and are sent
+         their games as they are played, as Sampling.py logs them.
+'''
+
+import argparse, asyncore, asynchat, socket, signal, os;
+import numpy;
+from timeit import default_timer as timer;
+
+from blackjack import *;
+from player import *;
+from deck import *;
+from events import Sink, TextSink;
+
+
+GAMES = [Whitejack, Greyjack, Blackjack];
+POLICIES = ['DRAW_BELOW_FOUR', 'DRAW_BELOW_THREE', 'DRAW_BELOW_SEVENTEEN'];
+PORT = 8007;
+LEARNING_RATE = 0.01;
+
+def main():
+    parser = argparse.ArgumentParser(prog="Server", description="%(prog)s hosts tables of White, Grey or Blackjack\
+            for remote players and bots, who all learn into one model.", epilog="This program was developed by Damola Mabogunje");
+
+    parser.add_argument('-t', '--type', metavar='GAME_TYPE', type=int, choices=range(len(GAMES)), default=0,
+                        help='Game Type. Must be an integer from [%(choices)s]'
+                       );
+
+    parser.add_argument('-H', '--host', metavar='HOST', default='localhost',
+                        help='Host to listen on.'
+                       );
+
+    parser.add_argument('-p', '--port', metavar='PORT', type=int, default=PORT,
+                        help='TCP port to listen on.'
+                       );
+
+    parser.add_argument('-x', '--unix', metavar='SOCKET',
+                        help='Listen on a Unix socket at this path instead of a TCP port.'
+                       );
+
+    parser.add_argument('-b', '--bots', metavar='BOTS', type=int, default=0,
+                        help='Number of tables at which a bot plays.'
+                       );
+
+    parser.add_argument('-g', '--games', metavar='GAMES', type=int,
+                        help='Stop once every bot has played this many games.'
+                       );
+
+    parser.add_argument('-r', '--rate', metavar='LEARNING_RATE', type=float, default=LEARNING_RATE,
+                        help='Speed of learning (online) of the shared models.'
+                       );
+
+    parser.add_argument('-s', '--seed', metavar='SEED', type=int,
+                        help='Seeds the decks of the tables.'
+                       );
+
+    args = parser.parse_args();
+
+    server = Server(GAMES[args.type], Dealer.POLICIES[POLICIES[args.type]], args.rate, args.seed);
+    server.listen_on((args.host, args.port) if not args.unix else args.unix);
+
+    for i in range(args.bots):
+        server.seat(Learner('Bot %d' % i, args.rate, GAMES[args.type].GOAL, online=True));
+
+    start = timer();
+
+    # Stop as on Ctrl-C when terminated, so the model is still printed
+    signal.signal(signal.SIGTERM, interrupt);
+
+    try:
+        server.serve(args.games);
+    except KeyboardInterrupt:
+        pass;
+    finally:
+        server.shutdown();
+
+    seconds = timer() - start;
+    games = server.games();
+
+    print "\nPlayed %d games (%d tables still open) in %.2f seconds (%.0f games/sec)" % (games, len(server.tables), seconds, games / max(seconds, 1e-9));
+    print "\nDealer state probabilities:"
+
+    for hand, weight in enumerate(server.dealer.weights):
+        print "%s => %s" % (hand, map(float, weight));
+
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt();
+
+
+class RemotePlayer(WhitejackPlayer):
+    '''
+    A player whose moves are sent to the server. The move he has sent
+    is waiting for him when the game asks him to play.
+    '''
+
+    __slots__ = ('move',);
+
+    def __init__(self, name, goal=4):
+        super(RemotePlayer, self).__init__(name, goal);
+        self.move = None;
+
+    def play(self, deck):
+        if self.move == Action.HIT:
+            return self.draw(1, deck);
+        else:
+            return self.stand();
+
+
+class Table(object):
+    '''
+    A game played a move at a time, for a player who answers later.
+
+    It is played as Whitejack.play plays it: in every round the dealer is dealt
+    his cards (if he has none), shown and moves, then the player. Here the round
+    waits for the player's move, and is resolved once it comes.
+    Once a game is over, the next is dealt.
+    '''
+
+    def __init__(self, game, dealer, player):
+        self.game = game;
+        self.dealer = dealer;
+        self.player = player;
+
+        self.moves = [None, None];
+        self.played = 0;
+
+    def start(self):
+        '''
+        Deals a new game and plays until the player's move is wanted
+        '''
+
+        del self.dealer.cards[:];
+        del self.player.cards[:];
+
+        self.game.deck.next_hand();
+        self.round();
+
+    def round(self):
+        sink = self.game.sink;
+
+        for i, p in enumerate([self.dealer, self.player]):
+            if not p.cards:
+                self.game.deal(p);
+
+            sink.hand(p);
+
+            if p is self.dealer:
+                self.moves[i] = self.game.decide(p);
+
+    def move(self, move):
+        '''
+        Plays the player's move and resolves the round.
+        Returns the winner should the game be over (None for a draw or if it is not)
+        '''
+
+        self.player.move = move;
+        self.moves[1] = self.game.decide(self.player);
+
+        for p, m in zip([self.dealer, self.player], self.moves):
+            self.game.sink.move(p, m);
+
+        if (Action.STAND in self.moves) or self.game.busted(self.dealer) or self.game.busted(self.player):
+            winner = self.game.resolve(self.dealer, self.player);
+            self.played += 1;
+            self.start();
+
+            return winner;
+
+        self.round();
+
+    def play(self):
+        '''
+        Plays a whole game at once, for a player who moves when asked (e.g. a bot)
+        '''
+
+        self.game.play(self.dealer, self.player);
+        self.played += 1;
+
+        del self.dealer.cards[:];
+        del self.player.cards[:];
+
+
+class Session(asynchat.async_chat):
+    '''
+    A remote player's connection. Each line received is a move
+    ("hit" or "hold"), or "quit". Everything the player's table
+    logs is sent back as it happens.
+    '''
+
+    MOVES = { 'hit': Action.HIT, 'hold': Action.STAND, 'stand': Action.STAND };
+    PROMPT = "> What will you do? (hit/hold)\n";
+
+    def __init__(self, sock, server):
+        asynchat.async_chat.__init__(self, sock, map=server.sockets);
+        self.set_terminator("\n");
+
+        self.server = server;
+        self.buffer = [];
+
+        self.table = server.seat(RemotePlayer('Player %d' % len(server.tables), server.game.GOAL), TextSink(self));
+        self.table.start();
+        self.push(Session.PROMPT);
+
+    def write(self, text):
+        self.push(text);
+
+    def collect_incoming_data(self, data):
+        self.buffer.append(data);
+
+    def found_terminator(self):
+        command = "".join(self.buffer).strip().lower();
+        self.buffer = [];
+
+        if command == 'quit':
+            self.close_when_done();
+        elif command in Session.MOVES:
+            self.table.move(Session.MOVES[command]);
+            self.push(Session.PROMPT);
+        elif command:
+            self.push("Unknown move '%s'\n" % command);
+
+    def handle_close(self):
+        self.server.unseat(self.table);
+        self.close();
+
+
+class Server(asyncore.dispatcher):
+    '''
+    Hosts any number of tables in one process. Remote players are served by
+    an asyncore event loop, so no table needs a thread of its own, and between
+    polls every bot table plays a game.
+
+    Every dealer learns (online) into one shared model, as does every bot
+    (See Learner.share). As only one table plays at a time, they need no locks.
+
+    Connections are watched with poll(), which (unlike select()) is not limited
+    to the first 1024 file descriptors, so thousands of players may be seated.
+    '''
+
+    def __init__(self, game=Whitejack, policy=Dealer.POLICIES['DRAW_BELOW_FOUR'], rate=LEARNING_RATE, seed=None):
+        self.sockets = dict();
+        asyncore.dispatcher.__init__(self, map=self.sockets);
+
+        self.game = game;
+        self.policy = policy;
+        self.rate = rate;
+        self.seeds = numpy.random.RandomState(seed);
+
+        self.dealer = Dealer('Dealer', rate, policy, game.GOAL, online=True);
+        self.learner = Learner('Bot', rate, game.GOAL, online=True);
+
+        self.tables = [];
+        self.bots = [];
+        self.played = 0; # Games played at tables since left
+
+    def listen_on(self, address):
+        '''
+        Listens on a TCP (host, port) or a Unix socket path
+        '''
+
+        if isinstance(address, tuple):
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM);
+            self.set_reuse_addr();
+        else:
+            if os.path.exists(address):
+                os.remove(address);
+
+            self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM);
+
+        self.bind(address);
+        self.listen(128);
+
+    def handle_accept(self):
+        connection = self.accept();
+
+        if connection is not None:
+            Session(connection[0], self);
+
+    def seat(self, player, sink=None):
+        '''
+        Sets up a table for player against a dealer of our own,
+        with its own seeded deck. Bots learn into the shared model.
+        '''
+
+        deck = Deck if self.game.GOAL == Whitejack.GOAL else FullDeck;
+        game = self.game(sink or Sink(), deck(self.seeds.randint(0, 2**31 - 1)));
+
+        dealer = Dealer('Dealer', self.rate, self.policy, self.game.GOAL, online=True);
+        dealer.share(self.dealer);
+
+        if isinstance(player, Learner):
+            player.share(self.learner);
+
+        table = Table(game, dealer, player);
+        self.tables.append(table);
+
+        if not isinstance(player, RemotePlayer):
+            self.bots.append(table);
+
+        return table;
+
+    def unseat(self, table):
+        '''
+        Clears the table of a player who has left, keeping count of the games played at it
+        '''
+
+        if table in self.tables:
+            self.tables.remove(table);
+            self.played += table.played;
+
+        if table in self.bots:
+            self.bots.remove(table);
+
+    def games(self):
+        '''
+        Returns the number of games played at every table, past and present
+        '''
+        return self.played + sum(table.played for table in self.tables);
+
+    def poll(self, timeout=0):
+        '''
+        Serves every connection that is ready, waiting at most timeout seconds for one
+        '''
+        asyncore.loop(timeout=timeout, map=self.sockets, count=1, use_poll=True);
+
+    def serve(self, games=None):
+        '''
+        Serves until interrupted or, given a number of games,
+        until every bot has played as many
+        '''
+
+        while games is None or any(table.played < games for table in self.bots) or not self.bots:
+            self.poll(0 if self.bots else 0.05);
+
+            for table in self.bots:
+                table.play();
+
+    def shutdown(self):
+        '''
+        Closes every connection, and stops listening
+        '''
+        asyncore.close_all(map=self.sockets);
+
+
+if __name__ == "__main__":
+    main();
@@ -0,0 +1,166 @@
+'''
+author: Damola Mabogunje
+contact: damola@mabogunje.net
+summary: This program plays out a grid of Blackjack rule variants: goals,
+         dealer stand thresholds, decks and player policies. For each variant
+         it generates the player's policy and finds its exact expected
+         return against the dealer.
+
+         Every variant is played as Blackjack is (See evaluation.py): the
+         player is dealt two cards and plays out his hand, then the dealer,
+         and only hands over the goal lose. So Whitejack (its deck, and goals
+         a two card hand may already be over) is not swept.
+
+         Variants are run on a pool of processes, one configuration of
+         goal, dealer and deck per task, so every player policy of a
+         configuration shares the dealer's odds (See odds.py).
+
+         Results are written as one CSV table of the form
+         goal,threshold,deck,player,return,dealer_bust,seconds
+'''
+
+import argparse, csv, sys;
+import numpy;
+from itertools import product;
+from multiprocessing import Pool;
+from timeit import default_timer as timer;
+
+from player import *;
+from deck import *;
+from odds import DealerOdds;
+from strategy import Strategy;
+from belief import BeliefStrategy;
+from evaluation import Evaluation;
+
+
+DECKS = { 'full': FullDeck, 'shoe': Shoe };
+MINIMUM_GOAL = 2 * Card.TEN; # The best hard hand of two cards, which must not bust
+PLAYERS = ['heuristic', 'expectimax', 'belief']; # As Gambling.py's solvers
+COLUMNS = ['goal', 'threshold', 'deck', 'player', 'return', 'dealer_bust', 'seconds'];
+
+def main():
+    parser = argparse.ArgumentParser(prog="Sweep", description="%(prog)s finds the expected return of every player\
+            policy in a grid of rule variants.", epilog="This program was developed by Damola Mabogunje");
+
+    parser.add_argument('-g', '--goals', metavar='GOAL', type=int, nargs='+', default=[21],
+                        help='Goals to play to. Each must be at least %d.' % MINIMUM_GOAL
+                       );
+
+    parser.add_argument('-d', '--thresholds', metavar='THRESHOLD', type=int, nargs='+', default=[17],
+                        help='Hands the dealer stands on (and above).'
+                       );
+
+    parser.add_argument('-k', '--decks', metavar='DECK', nargs='+', choices=sorted(DECKS.keys()), default=['full'],
+                        help='Decks to draw from. Each must be one of [%(choices)s]'
+                       );
+
+    parser.add_argument('-p', '--players', metavar='PLAYER', nargs='+', choices=PLAYERS, default=PLAYERS,
+                        help='Player policies to evaluate. Each must be one of [%(choices)s]'
+                       );
+
+    parser.add_argument('-w', '--workers', metavar='WORKERS', type=int, default=1,
+                        help='Number of processes to run the configurations on.'
+                       );
+
+    parser.add_argument('-o', '--output', metavar='OUTPUT',
+                        help='File to write the results to, instead of the console.'
+                       );
+
+    args = parser.parse_args();
+
+    if min(args.goals) < MINIMUM_GOAL:
+        parser.error('Goals below %d are not Blackjack variants (two cards could bust)' % MINIMUM_GOAL);
+
+    start = timer();
+    rows = run(args.goals, args.thresholds, args.decks, args.players, args.workers);
+
+    out = open(args.output, 'wb') if args.output else sys.stdout;
+    write(rows, out);
+
+    if args.output:
+        out.close();
+
+    sys.stderr.write("Ran %d variants in %.2f seconds\n" % (len(rows), timer() - start));
+
+def run(goals, thresholds, decks, players=PLAYERS, workers=1):
+    '''
+    Runs every variant in the grid and returns one row (a dict) per variant.
+    Variants sharing a goal, dealer threshold and deck are run together.
+    '''
+
+    for goal in goals:
+        if goal < MINIMUM_GOAL:
+            raise ValueError('Goals below %d are not Blackjack variants (two cards could bust)' % MINIMUM_GOAL);
+
+    tasks = [(goal, threshold, deck, players) for goal, threshold, deck in product(goals, thresholds, decks)];
+
+    if workers > 1:
+        pool = Pool(workers);
+        results = pool.map(configuration, tasks);
+        pool.close();
+    else:
+        results = map(configuration, tasks);
+
+    return [row for rows in results for row in rows];
+
+def write(rows, out):
+    writer = csv.DictWriter(out, COLUMNS);
+    writer.writeheader();
+    writer.writerows(rows);
+
+def configuration(task):
+    '''
+    Runs every player policy against one configuration of goal, dealer and deck.
+    The dealer's odds are worked out once, and shared by every player's policy.
+    '''
+
+    goal, threshold, name, players = task;
+
+    deck = DECKS[name]();
+    policy = ThresholdPolicy(threshold);
+    dealer = DealerOdds.get(policy, deck, goal);
+
+    bust = sum(p * dealer.upcard(upcard)[dealer.BUST] for upcard, p in dealer.composition);
+    rows = [];
+
+    for player in players:
+        start = timer();
+        evaluation = Evaluation(table(player, policy, deck, goal), policy, deck, goal);
+
+        rows.append({ 'goal': goal,
+                      'threshold': threshold,
+                      'deck': name,
+                      'player': player,
+                      'return': "%.6f" % evaluation.exact(),
+                      'dealer_bust': "%.6f" % bust,
+                      'seconds': "%.4f" % (timer() - start)
+                    });
+
+    return rows;
+
+def table(player, policy, deck, goal):
+    '''
+    Generates a player's policy against a dealer as a table
+    indexed by hand and upcard in half points (See BlackjackPlayer.compile)
+    '''
+
+    if player == 'heuristic':
+        return BlackjackPlayer(goal=goal).compile(policy, deck);
+
+    if player == 'expectimax':
+        strategy = Strategy(policy, deck, goal);
+    else:
+        strategy = BeliefStrategy.get(policy, deck, goal);
+
+    upcards = [card for card, p in strategy.dealer.composition];
+    moves = numpy.zeros((2 * (goal + 1) + 1, int(max(upcards) * 2) + 1), dtype=numpy.int8);
+
+    for h in range(len(moves)):
+        for upcard in upcards:
+            moves[h, int(upcard * 2)] = strategy.action(h / 2.0, upcard);
+
+    return moves;
+
+
+if __name__ == "__main__":
+    main();
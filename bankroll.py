@@ -0,0 +1,302 @@
+'''
+@author: Damola Mabogunje
+@contact: damola@mabogunje.net
+@summary: Simulates a player's bankroll over many sessions of Blackjack at once
+'''
+
+import numpy;
+from collections import namedtuple;
+from multiprocessing import Pool;
+
+from deck import FullDeck, Shoe;
+from blackjack import Blackjack;
+from events import Sink;
+from simulation import BatchGame;
+from evaluation import Evaluation;
+from counting import Counter, Estimate;
+
+'''
+The outcome of a batch of sessions, one entry per session.
+
+bankroll: What the player was left with
+drawdown: The most he was ever down from his best
+ruined:   Whether he was left unable to cover the table minimum
+hands:    Number of hands he played
+'''
+SESSION = namedtuple('SESSION', 'bankroll drawdown ruined hands');
+
+HOURLY = 100; # Hands played an hour
+
+
+class Cards(object):
+    '''
+    The cards of many paths (sessions), drawn with replacement as likely as they
+    are in the deck (See BatchGame). Every path draws from the same cards, so there
+    is nothing to count: the count is always 0.
+    '''
+
+    def __init__(self, deck, paths, seed=None):
+        self.engine = BatchGame(Blackjack(Sink(), deck), seed);
+        self.deck = deck;
+        self.paths = paths;
+
+    def draw(self, rows):
+        return self.engine.draw(len(rows));
+
+    def add(self, totals, cards):
+        return self.engine.add(totals, cards);
+
+    def buckets(self, rows):
+        return numpy.zeros(len(rows), dtype=numpy.int64) + Counter.BUCKETS.index(0);
+
+    def reshuffle(self):
+        pass;
+
+
+class Shoes(Cards):
+    '''
+    A Shoe for every path, held as the number of each card left in it (one row
+    per path), so each path is dealt from and counts its own shoe. A card is
+    drawn for many paths at once, each as likely as the cards left in its shoe.
+
+    Between hands, the shoes dealt past the cut card are reshuffled. RESERVE
+    cards are always left for the hand being played.
+    '''
+
+    RESERVE = 20;
+
+    def __init__(self, paths, decks=6, penetration=0.75, seed=None):
+        shoe = Shoe(decks);
+        super(Shoes, self).__init__(shoe, paths, seed);
+
+        faces = sorted(shoe.cards.items());
+
+        self.cards = numpy.array([int(c * 2) for c, n in faces], dtype=numpy.int64);
+        self.tags = numpy.array([Counter.TAGS[c] for c, n in faces], dtype=numpy.int64);
+        self.full = numpy.array([n for c, n in faces], dtype=numpy.int64);
+
+        self.total = self.full.sum();
+        self.cut = max(self.total - int(self.total * penetration), Shoes.RESERVE); # Cards left at the cut
+
+        self.left = numpy.tile(self.full, (paths, 1));
+        self.size = numpy.zeros(paths, dtype=numpy.int64) + self.total;
+        self.running = numpy.zeros(paths, dtype=numpy.int64);
+
+    def shuffle(self, rows):
+        self.left[rows] = self.full;
+        self.size[rows] = self.total;
+        self.running[rows] = 0;
+
+    def reshuffle(self):
+        self.shuffle(numpy.flatnonzero(self.size <= self.cut));
+
+    def draw(self, rows):
+        '''
+        Draws a card from the shoe of each path in rows (each at most once)
+        '''
+
+        left = self.left[rows];
+        chance = self.engine.rng.uniform(0, 1, len(rows)) * self.size[rows];
+        pick = (left.cumsum(1) <= chance[:, numpy.newaxis]).sum(1);
+
+        self.left[rows, pick] -= 1;
+        self.size[rows] -= 1;
+        self.running[rows] += self.tags[pick];
+
+        return self.cards[pick];
+
+    def buckets(self, rows):
+        '''
+        Returns the index (into Counter.BUCKETS) of each path's true count (See Counter.bucket)
+        '''
+
+        counts = numpy.floor(self.running[rows] / (numpy.maximum(self.size[rows], 1) / Counter.DECK));
+
+        return numpy.clip(counts, Counter.BUCKETS[0], Counter.BUCKETS[-1]).astype(numpy.int64) - Counter.BUCKETS[0];
+
+
+class Betting(object):
+    '''
+    How much a player bets on each hand, given his bankroll and the count
+    (as bucket indices, See Counter.BUCKETS). The unit is the table minimum.
+    The base scheme bets it flat.
+    '''
+
+    def __init__(self, unit=1.0):
+        self.unit = unit;
+
+    def bet(self, bankroll, buckets):
+        return numpy.zeros(len(bankroll)) + self.unit;
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, self.unit);
+
+
+class FlatBetting(Betting):
+    '''
+    Bets the table minimum on every hand
+    '''
+    pass;
+
+
+class KellyBetting(Betting):
+    '''
+    Bets the fraction of his bankroll that maximises its growth: his edge over
+    the variance of a hand's return. Every return is -1, 0 or 1, so the variance
+    is at most 1 and is taken as 1. Without an edge, he bets the table minimum.
+
+    His edge at each count is given by bucket (e.g. as Evaluation.exact finds it
+    against each Estimate), and a fraction of the full Kelly bet may be made.
+    '''
+
+    VARIANCE = 1.0;
+
+    def __init__(self, edges, fraction=1.0, unit=1.0):
+        super(KellyBetting, self).__init__(unit);
+        self.edges = numpy.asarray(edges, dtype=float);
+        self.fraction = fraction;
+
+    def bet(self, bankroll, buckets):
+        kelly = self.fraction * self.edges[buckets] / KellyBetting.VARIANCE * bankroll;
+
+        return numpy.maximum(kelly, self.unit);
+
+    def __repr__(self):
+        return "KellyBetting(%s, %s)" % (self.fraction, self.unit);
+
+
+class CountBetting(Betting):
+    '''
+    Bets a unit for each point of the true count, from 1 up to `spread` units
+    '''
+
+    def __init__(self, spread=8, unit=1.0):
+        super(CountBetting, self).__init__(unit);
+        self.spread = spread;
+
+    def bet(self, bankroll, buckets):
+        counts = numpy.array(Counter.BUCKETS)[buckets];
+
+        return self.unit * numpy.clip(counts, 1, self.spread);
+
+    def __repr__(self):
+        return "CountBetting(%s, %s)" % (self.spread, self.unit);
+
+
+class Session(object):
+    '''
+    Sessions of a player betting on hands played by a strategy table against a dealer
+    (See Evaluation). Each starts with the same bankroll and lasts a number of hands,
+    or until the player cannot cover the table minimum (he is ruined).
+
+    Every session is a path through the same hands, so a batch of sessions is
+    played a hand at a time, with every live session's hand played at once.
+    '''
+
+    CHUNK = 2**16; # Most sessions simulated at once
+
+    def __init__(self, table, policy, betting, bankroll=100.0, hands=1000, goal=21):
+        self.table = table;
+        self.policy = policy;
+        self.betting = betting;
+        self.bankroll = bankroll;
+        self.hands = hands;
+        self.goal = goal;
+
+    def play(self, engine):
+        '''
+        Plays a session on each of the engine's paths and returns their outcome
+        '''
+
+        n = engine.paths;
+        evaluation = Evaluation(self.table, self.policy, engine.deck, self.goal);
+
+        bankroll = numpy.zeros(n) + self.bankroll;
+        peak = bankroll.copy();
+        drawdown = numpy.zeros(n);
+        hands = numpy.zeros(n, dtype=numpy.int64);
+        rows = numpy.arange(n);
+
+        for hand in range(self.hands):
+            rows = rows[bankroll[rows] >= self.betting.unit];
+
+            if not rows.size:
+                break;
+
+            bets = numpy.minimum(self.betting.bet(bankroll[rows], engine.buckets(rows)), bankroll[rows]);
+            bankroll[rows] += bets * evaluation.play(engine, rows.size, rows);
+            hands[rows] += 1;
+
+            peak[rows] = numpy.maximum(peak[rows], bankroll[rows]);
+            drawdown[rows] = numpy.maximum(drawdown[rows], peak[rows] - bankroll[rows]);
+
+            engine.reshuffle();
+
+        return SESSION(bankroll, drawdown, bankroll < self.betting.unit, hands);
+
+    def simulate(self, sessions, decks=None, penetration=0.75, seed=None, workers=1):
+        '''
+        Plays sessions (in chunks, split between workers), from an infinite deck or,
+        given a number of decks, each from a shoe of its own. Returns their outcomes.
+        '''
+
+        chunks = [min(Session.CHUNK, sessions - start) for start in range(0, sessions, Session.CHUNK)];
+        seeds = numpy.random.RandomState(seed).randint(0, 2**31 - 1, len(chunks)) if seed is not None else [None] * len(chunks);
+        tasks = [(self, n, decks, penetration, chunk_seed) for n, chunk_seed in zip(chunks, seeds)];
+
+        if workers > 1:
+            pool = Pool(workers);
+            outcomes = pool.map(play, tasks);
+            pool.close();
+        else:
+            outcomes = map(play, tasks);
+
+        return SESSION(*[numpy.concatenate(column) for column in zip(*outcomes)]);
+
+    @staticmethod
+    def edges(table, policy, goal=21, decks=None):
+        '''
+        Returns the player's edge at each count (See Counter.BUCKETS): against the
+        composition expected at the count in a shoe, or against a full deck at every count
+        '''
+
+        if decks:
+            return [Evaluation(table, policy, Estimate(count), goal).exact() for count in Counter.BUCKETS];
+
+        return [Evaluation(table, policy, FullDeck(), goal).exact()] * len(Counter.BUCKETS);
+
+
+def play(task):
+    '''
+    Plays a chunk of the sessions of a simulation in a worker process
+    '''
+
+    session, n, decks, penetration, seed = task;
+
+    if decks:
+        engine = Shoes(n, decks, penetration, seed);
+    else:
+        engine = Cards(FullDeck(), n, seed);
+
+    return session.play(engine);
+
+def summary(outcome, bankroll, hourly=HOURLY):
+    '''
+    Returns the risk of ruin, the drawdowns at the 50th, 90th and 99th percentiles
+    and the expected winnings an hour (at `hourly` hands), with its standard error
+    '''
+
+    hours = outcome.hands / float(hourly);
+    won = outcome.bankroll - bankroll;
+
+    rate = won.sum() / max(hours.sum(), 1e-9);
+    per_hour = won / numpy.maximum(hours, 1e-9);
+    error = per_hour.std() / numpy.sqrt(len(won)) if len(won) > 1 else float('nan');
+
+    return { 'sessions': len(won),
+             'ruin': numpy.count_nonzero(outcome.ruined) / float(len(won)),
+             'drawdown': dict((q, numpy.percentile(outcome.drawdown, q)) for q in (50, 90, 99)),
+             'hourly': rate,
+             'hourly_error': error,
+             'bankroll': outcome.bankroll.mean()
+           };
@@ -0,0 +1,168 @@
+'''
+@author: Damola Mabogunje
+@contact: damola@mabogunje.net
+@summary: Optimal hit/stand strategy by value iteration over belief states
+'''
+
+import numpy;
+from math import floor;
+
+try:
+    from scipy import sparse;
+except ImportError:
+    sparse = None; # Transitions are held as dense numpy arrays instead
+
+from deck import Card;
+from player import Action;
+from odds import DealerOdds;
+
+
+class BeliefStrategy(object):
+    '''
+    Solves the game as the POMDP it is. The player never sees the dealer's hole card,
+    so he acts on a belief: the probability of every total the dealer may finish on,
+    given his upcard (See DealerOdds.upcard). The cards the player draws tell him
+    nothing of the dealer's, so the belief is fixed by the upcard and every belief
+    state is a (hand, upcard) pair.
+
+    Hands are indexed in half points (as in DealerOdds), with the last index for
+    BUST. Each action is a transition matrix between hands and a reward in every
+    belief state: hitting moves to the hand drawn to for nothing, while standing
+    ends the game for its expected winnings against the belief. Values are found
+    for every hand against every upcard at once by iterating
+
+        V = max(R[a] + P[a] V)
+
+    over the actions until they stop changing. Transitions are sparse (a hand only
+    moves to those a card away), and are held as SciPy sparse matrices where SciPy
+    is installed.
+
+    Converged values are memoized by policy, deck composition and goal,
+    and may be kept on disk between runs (See cache.py).
+    '''
+
+    SOLVED = dict(); # (policy, deck composition, goal) -> BeliefStrategy
+    TOLERANCE = 1e-12;
+    ITERATIONS = 1000;
+
+    @staticmethod
+    def get(policy, deck, goal=21, cache=None):
+        '''
+        Returns the (memoized) strategy against a dealer using policy to draw from deck
+        '''
+        composition = tuple(sorted(deck.composition().items()));
+        key = (policy, composition, goal);
+
+        if key not in BeliefStrategy.SOLVED:
+            BeliefStrategy.SOLVED[key] = BeliefStrategy(policy, deck, goal, cache);
+
+        return BeliefStrategy.SOLVED[key];
+
+    def __init__(self, policy, deck, goal=21, cache=None):
+        self.dealer = DealerOdds.get(policy, deck, goal);
+        self.goal = goal;
+
+        self.size = self.dealer.size;
+        self.BUST = self.dealer.BUST;
+        self.upcards = [card for card, p in self.dealer.composition];
+        self.columns = dict((upcard, j) for j, upcard in enumerate(self.upcards));
+
+        config = ('belief', policy, self.dealer.composition, goal);
+        stored = cache.load(config) if cache else None;
+
+        if stored is None:
+            self.values, self.actions = self.solve(self.transitions(), self.rewards());
+
+            if cache:
+                cache.save(config, { 'values': self.values, 'actions': self.actions });
+        else:
+            self.values, self.actions = stored['values'], stored['actions'];
+
+    def index(self, hand):
+        return self.BUST if floor(hand) > self.goal else int(hand * 2);
+
+    def transitions(self):
+        '''
+        Returns the transition matrix of each action between hands. A busted hand
+        stays busted, and standing leaves the game (so it has no transitions).
+        '''
+
+        rows, cols, probabilities = [], [], [];
+
+        for h in range(self.BUST):
+            if h % 2 and h / 2.0 < Card.ACE:
+                continue; # No soft hand is below an ACE
+
+            for card, p in self.dealer.composition:
+                rows.append(h);
+                cols.append(self.index(Card.add(h / 2.0, card, self.goal)));
+                probabilities.append(p);
+
+        rows.append(self.BUST);
+        cols.append(self.BUST);
+        probabilities.append(1.0);
+
+        if sparse is not None:
+            hit = sparse.csr_matrix((probabilities, (rows, cols)), shape=(self.size, self.size));
+        else:
+            hit = numpy.zeros((self.size, self.size));
+            numpy.add.at(hit, (rows, cols), probabilities);
+
+        return { Action.HIT: hit, Action.STAND: None };
+
+    def rewards(self):
+        '''
+        Returns the reward of each action in every belief state, indexed by hand and upcard.
+        Standing is worth p(WIN) - p(LOSE) against the dealer's belief, and a busted hand -1.
+        '''
+
+        # Every belief, one column per upcard
+        pDealer = numpy.column_stack([self.dealer.upcard(upcard) for upcard in self.upcards]);
+        pFinal = pDealer[:self.BUST];
+
+        hands = (numpy.arange(self.size) // 2)[:, numpy.newaxis];
+        finals = self.dealer.finals[numpy.newaxis, :];
+
+        # {p(BUST) + p(WORSE_HAND)} - p(BETTER_HAND), for every hand we could hold
+        stand = pDealer[self.BUST] + (finals < hands).dot(pFinal) - (finals > hands).dot(pFinal);
+        stand[self.BUST] = -1.0;
+
+        return { Action.HIT: numpy.zeros_like(stand), Action.STAND: stand };
+
+    def solve(self, transitions, rewards):
+        '''
+        Iterates the values of every belief state until they converge.
+        Returns them, with the best action in each state.
+        '''
+
+        # Ties go to the first action, so standing comes first (as Strategy prefers it)
+        actions = [Action.STAND] + [a for a in rewards if a != Action.STAND];
+
+        # Start from standing everywhere, as a busted hand is worth no more
+        values = rewards[Action.STAND];
+
+        for i in range(BeliefStrategy.ITERATIONS):
+            q = numpy.array([rewards[a] + (transitions[a].dot(values) if transitions[a] is not None else 0) for a in actions]);
+            updated = q.max(0);
+            converged = numpy.abs(updated - values).max() < BeliefStrategy.TOLERANCE;
+            values = updated;
+
+            if converged:
+                break;
+
+        best = numpy.array(actions)[q.argmax(0)];
+
+        return (values, best.astype(numpy.int8));
+
+    def value(self, hand, upcard):
+        return float(self.values[self.index(hand), self.columns[upcard]]);
+
+    def action(self, hand, upcard):
+        return int(self.actions[self.index(hand), self.columns[upcard]]);
+
+    def table(self, hands, upcards):
+        '''
+        Returns the best action for every hand against every upcard
+        as a list of (hand, upcard, action)
+        '''
+        return [(hand, upcard, self.action(hand, upcard)) for hand in hands for upcard in upcards];
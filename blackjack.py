@@ -4,8 +4,11 @@
 @summary: The game of Whitejack
 '''
 
+from math import floor;
+
 from deck import *;
 from player import *;
+from events import *;
 
 class Whitejack(object):
     '''
@@ -13,57 +16,112 @@ class Whitejack(object):
     The player and dealer are each dealt one card, face up. Each is allowed to request additional cards (hits).
     The player wins by scoring higher than the dealer without busting, which occurs when the sum of card values 
     reaches 5 or more.
+
+    A game is played as a state machine. In turn, each player is dealt his cards (if he has none)
+    and decides on his move. Once both have moved the round is resolved, and either the game
+    is over or another round is played.
     '''
 
     MATCH = "%s versus %s";
     WINNER = "%s wins!";
     GOAL = 4; 
+    DEAL = 1;
     (LOSE, WIN) = range(0, 2); 
+    (DEALING, DECIDING, RESOLVING, OVER) = range(0, 4);
+
+    def __init__(self, sink=None, deck=None):
+        self.deck = deck or Deck();
+        self.sink = sink or TextSink();
 
-    def __init__(self):
-        self.deck = Deck();
+        # Reused by every hand played
+        self.players = [None, None];
+        self.moves = [None, None];
 
     def play(self, plyrA, plyrB, starting_hand=None):
+        '''
+        Plays a game between plyrA and plyrB, rigging the dealer's
+        `starting_hand` if provided, and returns the winner (None for a draw)
+        '''
+
+        players = self.players;
+        moves = self.moves;
+        players[0], players[1] = plyrA, plyrB;
+
+        phase = Whitejack.DEALING;
+        turn = 0;
+        winner = None;
+
+        self.deck.next_hand();
 
-        players = [plyrA, plyrB];
-        moves = [];
+        while phase is not Whitejack.OVER:
+            p = players[turn];
 
+            if phase is Whitejack.DEALING:
+                # Deal cards if they have not been dealt
+                if not p.cards:
+                    self.deal(p, starting_hand);
 
-        # Deal cards if they have not been dealt, then show hand and decide on next move.
-        for p in players:
-            if p.cards:
-                pass;
-            else:
-                # Rig dealer `starting_hand` if provided
-                if starting_hand and isinstance(p, Dealer):
-                    p.cards.append(starting_hand);
-                    p.learn(0, starting_hand, None);
+                phase = Whitejack.DECIDING;
+
+            elif phase is Whitejack.DECIDING:
+                # Show hand and decide on next move
+                self.sink.hand(p);
+                moves[turn] = self.decide(p);
+
+                turn = (turn + 1) % len(players);
+                phase = Whitejack.DEALING if turn else Whitejack.RESOLVING;
+
+            elif phase is Whitejack.RESOLVING:
+                # Show moves
+                for i, p in enumerate(players):
+                    self.sink.move(p, moves[i]);
+
+                # Game ends if a player stands or busts
+                if (Action.STAND in moves) or self.busted(plyrA) or self.busted(plyrB):
+                    winner = self.resolve(plyrA, plyrB);
+                    phase = Whitejack.OVER;
                 else:
-                    p.draw(1, self.deck);
+                    phase = Whitejack.DEALING;
 
-            
-            print "%s's Hand: %s" % (p.name, p.cards);
-            moves.append(p.play(self.deck));
+        return winner;
 
-        # Show hands and moves
-        for i, p in enumerate(players):
-            print "%s performed '%s'" % (p.name, Action.describe(moves[i]));
+    def play_many(self, n, plyrA, plyrB, starting_hand=None):
+        '''
+        Plays n games back to back, clearing the players' cards after each
+        '''
 
-        # Game ends if a player stands or busts
-        if (Action.STAND in moves) or ((Whitejack.GOAL+1) in [plyrA.hand(), plyrB.hand()]):
-            winner = self.winner(plyrA, plyrB);
+        for i in xrange(n):
+            self.play(plyrA, plyrB, starting_hand);
 
-            if winner is None:
-                print self.MATCH % (plyrA.cards, plyrB.cards), "DRAW";
-            else:
-                winner.learn((Whitejack.GOAL+1),0, None); # ::HACK:: Force learning that BUST takes you START
-                winner.learn(winner.hand() - winner.cards[-1], winner.hand(), self.WIN);
-                print Whitejack.MATCH % (plyrA.cards, plyrB.cards), self.WINNER % winner.name;
+            del plyrA.cards[:];
+            del plyrB.cards[:];
 
-            return;
+    def deal(self, p, starting_hand=None):
+        # Rig dealer `starting_hand` if provided
+        if starting_hand and isinstance(p, Dealer):
+            p.cards.append(starting_hand);
+            p.learn(0, starting_hand, None);
         else:
-            return self.play(plyrA, plyrB);
+            p.draw(self.DEAL, self.deck);
+
+    def decide(self, p):
+        return p.play(self.deck);
+
+    def busted(self, p):
+        return floor(p.hand()) > self.GOAL;
 
+    def resolve(self, plyrA, plyrB):
+        '''
+        Finds the winner of a finished game and, if he is a Learner, lets him learn from it
+        '''
+        winner = self.winner(plyrA, plyrB);
+
+        if isinstance(winner, Learner):
+            winner.learn((self.GOAL+1),0, None); # ::HACK:: Force learning that BUST takes you START
+            winner.learn(winner.hand() - winner.cards[-1], winner.hand(), self.WIN);
+
+        self.sink.result(self, plyrA, plyrB, winner);
+        return winner;
 
     def winner(self, plyrA, plyrB):
 
@@ -91,52 +149,53 @@ class Blackjack(Whitejack):
     '''
 
     GOAL = 21;
+    DEAL = 2;
 
-    def __init__(self):
-        self.deck = FullDeck();
-
-    def play(self, plyrA, plyrB, starting_hand=None):
+    def __init__(self, sink=None, deck=None):
+        super(Blackjack, self).__init__(sink, deck or FullDeck());
 
-        players = [plyrA, plyrB];
-        moves = [];
+    def deal(self, p, starting_hand=None):
+        '''
+        The dealer's second card is his hole card, dealt face down
+        and only revealed once the game is resolved (See resolve)
+        '''
 
+        if isinstance(p, Dealer) and not starting_hand:
+            p.cards.extend(self.deck.draw(1));
+            p.cards.extend(self.deck.draw_hidden(self.DEAL - 1));
+        else:
+            super(Blackjack, self).deal(p, starting_hand);
 
-        # Deal cards if they have not been dealt, then show hand and decide on next move.
-        for p in players:
-            if p.cards:
-                pass;
-            else:
-                # Rig dealer `starting_hand` if provided
-                if starting_hand and isinstance(p, Dealer):
-                    p.cards.append(starting_hand);
-                    p.learn(0, starting_hand, None);
-                else:
-                    p.draw(2, self.deck);
+    def resolve(self, plyrA, plyrB):
+        self.deck.reveal();
 
-            
-            print "%s's Hand: %s" % (p.name, p.cards);
+        return super(Blackjack, self).resolve(plyrA, plyrB);
 
-            if isinstance(p, BlackjackAgent):
-                dealer = next(obj for obj in players if isinstance(obj, Dealer));
-                moves.append(p.play(self.deck, dealer.upcard())); 
-            else:
-                moves.append(p.play(self.deck));
+    def winner(self, plyrA, plyrB):
+        '''
+        Unlike Whitejack, a hand only loses once it is over the GOAL (See busted),
+        so 21 beats any lower hand. Hands are compared on their floor, as a soft hand
+        is marked by its half point.
+        '''
 
-        # Show hands and moves
-        for i, p in enumerate(players):
-            print "%s performed '%s'" % (p.name, Action.describe(moves[i]));
+        a, b = floor(plyrA.hand()), floor(plyrB.hand());
 
-        # Game ends if a player stands or busts
-        if (Action.STAND in moves) or ((Blackjack.GOAL+1) in [plyrA.hand(), plyrB.hand()]):
-            winner = self.winner(plyrA, plyrB);
+        if a == b:
+            return None;
+        elif self.busted(plyrA):
+            return plyrB;
+        elif self.busted(plyrB):
+            return plyrA;
+        else:
+            return plyrA if a > b else plyrB;
 
-            if winner is None:
-                print Blackjack.MATCH % (plyrA.cards, plyrB.cards), "DRAW";
-            else:
-                winner.learn((Blackjack.GOAL+1),0, None); # ::HACK:: Force learning that BUST takes you START
-                winner.learn(winner.hand() - winner.cards[-1], winner.hand(), Blackjack.WIN);
-                print Blackjack.MATCH % (plyrA.cards, plyrB.cards), Blackjack.WINNER % winner.name;
+    def decide(self, p):
+        '''
+        A BlackjackPlayer plays against the dealer's policy and upcard
+        '''
 
-            return;
+        if isinstance(p, BlackjackPlayer):
+            dealer = next(obj for obj in self.players if isinstance(obj, Dealer));
+            return p.play(self.deck, dealer.policy, dealer.upcard());
         else:
-            return self.play(plyrA, plyrB);
+            return p.play(self.deck);
@@ -0,0 +1,85 @@
+'''
+@author: Damola Mabogunje
+@contact: damola@mabogunje.net
+@summary: Keeps learnt matrices and generated policies on disk between runs
+'''
+
+import os, glob, hashlib, tempfile;
+import numpy;
+
+
+DIRECTORY = '.cache';
+
+class Cache(object):
+    '''
+    Stores named arrays as compressed .npz files in a directory.
+
+    Each file is named by a hash of the configuration that produced it
+    (the game, deck, dealer policy, seed and so on, as a tuple whose repr
+    is stable) followed by the number of samples it took, e.g.
+
+        3f2a...9c_1000.npz
+
+    so a run may reuse the results of an identical run, or resume from
+    those of a shorter one.
+    '''
+
+    def __init__(self, directory=DIRECTORY):
+        self.directory = directory;
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory);
+
+    @staticmethod
+    def deck(deck):
+        '''
+        Returns the configuration of a deck: its kind and composition
+        '''
+        return (deck.__class__.__name__, tuple(sorted(deck.composition().items())));
+
+    def key(self, config):
+        return hashlib.sha1(repr(config)).hexdigest();
+
+    def path(self, config, samples=0):
+        return os.path.join(self.directory, "%s_%d.npz" % (self.key(config), samples));
+
+    def load(self, config, samples=0):
+        '''
+        Returns the arrays stored for config and samples as a dict, or None
+        '''
+
+        path = self.path(config, samples);
+
+        if not os.path.exists(path):
+            return None;
+
+        with numpy.load(path) as stored:
+            return dict((name, stored[name]) for name in stored.files);
+
+    def latest(self, config, samples):
+        '''
+        Returns the most samples stored for config (up to samples) and their arrays,
+        or (0, None) if there are none
+        '''
+
+        prefix = os.path.join(self.directory, self.key(config) + "_");
+        stored = [int(path[len(prefix):-len(".npz")]) for path in glob.glob(prefix + "*.npz")];
+        stored = [n for n in stored if n <= samples];
+
+        if not stored:
+            return (0, None);
+
+        return (max(stored), self.load(config, max(stored)));
+
+    def save(self, config, arrays, samples=0):
+        '''
+        Stores arrays (a dict of names to arrays) for config and samples.
+        They are written to a temporary file first, so a file in the cache
+        is never incomplete.
+        '''
+
+        handle, temp = tempfile.mkstemp(suffix=".npz", dir=self.directory);
+        os.close(handle);
+
+        numpy.savez_compressed(temp, **arrays);
+        os.rename(temp, self.path(config, samples));
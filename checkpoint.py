@@ -0,0 +1,45 @@
+'''
+@author: Damola Mabogunje
+@contact: damola@mabogunje.net
+@summary: Saves the progress of a long run so that it may be resumed
+'''
+
+import os, tempfile;
+import cPickle as pickle;
+
+
+class Checkpoint(object):
+    '''
+    A checkpoint is a file holding everything needed to carry on a run
+    exactly where it stopped: what has been learnt, how far the run got,
+    and the random number generators (with the cards they had generated).
+
+    Checkpoints are written to a temporary file and renamed over the last,
+    so an interrupted save leaves the previous checkpoint whole.
+    '''
+
+    def __init__(self, path, every=None):
+        self.path = path;
+        self.every = every; # Games played between checkpoints
+
+    def exists(self):
+        return os.path.exists(self.path);
+
+    def save(self, **progress):
+        handle, temp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(os.path.abspath(self.path)));
+
+        with os.fdopen(handle, 'wb') as out:
+            pickle.dump(progress, out, pickle.HIGHEST_PROTOCOL);
+
+        os.rename(temp, self.path);
+
+    def load(self):
+        '''
+        Returns the progress saved (as a dict), or None if there is none
+        '''
+
+        if not self.exists():
+            return None;
+
+        with open(self.path, 'rb') as saved:
+            return pickle.load(saved);
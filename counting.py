@@ -0,0 +1,153 @@
+'''
+@author: Damola Mabogunje
+@contact: damola@mabogunje.net
+@summary: Counts the cards dealt from a shoe, and plays by the count
+'''
+
+import numpy;
+from math import floor;
+
+from deck import Card, Shoe;
+from player import Action, BlackjackPlayer;
+
+
+class Counter(object):
+    '''
+    A Hi-Lo count of the cards dealt from a shoe (See Shoe.watch).
+    Low cards (2 - 6) count +1, high cards (the 10s and ACE) -1 and the rest 0,
+    so the running count rises as the shoe is left rich in high cards.
+    The true count is the running count per deck left in the shoe.
+
+    Each card dealt is counted once, as it is dealt, so keeping the count costs
+    nothing more per card. The dealer's hole card is counted once it is revealed.
+    A counter set to watch a shoe already being dealt first counts the cards gone.
+    '''
+
+    TAGS = { Card.TWO: 1, Card.THREE: 1, Card.FOUR: 1, Card.FIVE: 1, Card.SIX: 1,
+             Card.SEVEN: 0, Card.EIGHT: 0, Card.NINE: 0,
+             Card.TEN: -1, Card.ACE: -1 };
+
+    DECK = 52.0;
+    BUCKETS = range(-5, 6); # True counts are bucketed to whole counts, and clipped to these
+
+    def __init__(self):
+        self.shoe = None;
+        self.running = 0;
+
+    def watch(self, shoe):
+        if not isinstance(shoe, Shoe):
+            raise TypeError('Only the cards dealt from a Shoe can be counted, not from a %s' % shoe.__class__.__name__);
+
+        shoe.watch(self);
+        self.shoe = shoe;
+        self.running = sum(Counter.TAGS[card] * n for card, n in shoe.dealt().items());
+
+    def shuffled(self, shoe):
+        self.shoe = shoe;
+        self.running = 0;
+
+    def dealt(self, card):
+        self.running += Counter.TAGS[card];
+
+    def decks(self):
+        '''
+        Returns the number of decks left in the shoe
+        '''
+        return max(self.shoe.size, 1) / Counter.DECK;
+
+    def true_count(self):
+        return self.running / self.decks();
+
+    def bucket(self):
+        '''
+        Returns the index (into BUCKETS) of the true count's bucket
+        '''
+        count = int(floor(self.true_count()));
+
+        return min(max(count, Counter.BUCKETS[0]), Counter.BUCKETS[-1]) - Counter.BUCKETS[0];
+
+
+class Estimate(object):
+    '''
+    The composition of a shoe at a true count. Plays the part of a deck wherever
+    only its composition is needed (e.g. DealerOdds and BlackjackPlayer.compile).
+
+    A true count of c means c more low cards than high cards have been dealt per
+    deck left. So, per deck, c/2 cards are taken evenly from the low cards and
+    c/2 added to the high cards in proportion to their number.
+    '''
+
+    def __init__(self, count):
+        self.count = count;
+
+        cards = dict.fromkeys(Shoe.CARDS, 0.0);
+        for card in Shoe.CARDS:
+            cards[card] += Shoe.SUITS;
+
+        low = [c for c in cards if Counter.TAGS[c] > 0];
+        high = [c for c in cards if Counter.TAGS[c] < 0];
+        highs = sum(cards[c] for c in high);
+
+        for c in low:
+            cards[c] = max(cards[c] - count / 2.0 / len(low), 0.0);
+
+        for c in high:
+            cards[c] = max(cards[c] + count / 2.0 * cards[c] / highs, 0.0);
+
+        size = sum(cards.values());
+        self.probabilities = dict((c, n / size) for c, n in cards.items() if n > 0);
+
+    def composition(self):
+        return dict(self.probabilities);
+
+    def __repr__(self):
+        return "Estimate(%d)" % self.count;
+
+
+class CountingPlayer(BlackjackPlayer):
+    '''
+    A BlackjackPlayer who counts the cards dealt from a shoe. Against each
+    policy he compiles one table per count bucket, each against the composition
+    the shoe is expected to have at that count (See Estimate). Each move is then
+    a lookup in the table of the current count, so the dealer's odds are never
+    worked out again as the shoe is dealt.
+
+    He counts the shoe he is seated at, or else the one he first plays from
+    (counting the cards already dealt from it).
+    '''
+
+    __slots__ = ('counter', 'tables');
+
+    def __init__(self, name="Counter", rate=0.5, goal=21, shoe=None):
+        super(CountingPlayer, self).__init__(name, rate, goal);
+        self.counter = Counter();
+        self.tables = dict(); # policy -> table of every bucket, indexed by bucket, hand and upcard
+
+        if shoe is not None:
+            self.counter.watch(shoe);
+
+    def play(self, deck, policy, upcard):
+
+        if self.counter.shoe is not deck:
+            self.counter.watch(deck);
+
+        if policy not in self.tables:
+            self.prepare(policy);
+
+        table = self.tables[policy][self.counter.bucket()];
+        hand = min(int(self.hand() * 2), len(table) - 1);
+
+        if table[hand, int(upcard * 2)] == Action.HIT:
+            return self.draw(1, deck);
+        else:
+            return self.stand();
+
+    def prepare(self, policy):
+        '''
+        Compiles the table of every count bucket against policy
+        '''
+
+        tables = [self.compile(policy, Estimate(count)) for count in Counter.BUCKETS];
+        self.tables[policy] = numpy.array(tables);
+
+        return self.tables[policy];
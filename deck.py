@@ -4,7 +4,8 @@
 @summary: Defines the classes necessary for a deck of cards
 '''
 
-from random import choice;
+import numpy;
+from math import floor;
 
 
 class Card:
@@ -14,23 +15,121 @@ class Card:
     math.floor and math.ceil are used elsewhere on it for other purposes
     '''
 
-    (ONE, TWO, THREE, FOUR, FIVE, SIX, SEVEN, EIGHT, NINE, KING, QUEEN, JACK, ACE) = [1,2,3,4,5,6,7,8,9,10,10,10,11.5];
+    (ONE, TWO, THREE, FOUR, FIVE, SIX, SEVEN, EIGHT, NINE, TEN, KING, QUEEN, JACK, ACE) = [1,2,3,4,5,6,7,8,9,10,10,10,10,11.5];
+
+    @staticmethod
+    def add(total, card, goal):
+        '''
+        Adds a card to a hand total. A hand holding an ACE counted at 11.5 is soft.
+        A second ACE in a soft hand is counted as ONE, and a soft hand that goes 
+        over the goal counts its ACE as ONE instead.
+        '''
+        soft = (total != floor(total));
+
+        if soft and card == Card.ACE:
+            card = Card.ONE;
+
+        total += card;
+
+        if floor(total) > goal and total != floor(total):
+            total -= (Card.ACE - Card.ONE);
+
+        return total;
+
+
+def generator(seed=None, bits='PCG64'):
+    '''
+    Returns a random number generator seeded with seed.
+    Where numpy provides them, any of its bit generators (e.g. PCG64, Philox) may be used.
+    Older versions of numpy only provide the Mersenne Twister (RandomState).
+
+    A generator passed in as seed is returned as it is.
+    '''
+
+    if hasattr(seed, 'choice'):
+        return seed;
+
+    if hasattr(numpy.random, 'Generator'):
+        return numpy.random.Generator(getattr(numpy.random, bits)(seed));
+
+    return numpy.random.RandomState(seed);
 
 
 class Deck(object):
     '''
     A Whitejack deck of cards
+
+    Cards are generated in blocks of `block` cards at a time
+    and handed out from the block as they are drawn.
     '''
 
     SIZE = float("inf");
     CARDS = [Card.ONE, Card.TWO, Card.THREE, Card.FOUR];
+    BLOCK = 4096;
 
-    def __init__(self):
+    def __init__(self, seed=None, block=BLOCK):
         self.cards = Deck.CARDS;
         self.size = Deck.SIZE;
 
+        # Every card is always left in an infinite deck
+        self.cards_left = self.cards;
+        self.block = block;
+        self.prepare(seed);
+
+    def prepare(self, seed=None, block=None):
+        '''
+        Seeds the deck and discards any cards generated before.
+        The block size is kept, unless another is given.
+        '''
+        self.rng = generator(seed);
+        self.block = block or self.block;
+        self.generated = [];
+        self.cursor = 0;
+
+    def generate(self, num=0):
+        '''
+        Generates the next block of cards, keeping any not yet drawn.
+        Should num cards be wanted, more than a block is generated if need be.
+        '''
+        faces = numpy.array(self.cards_left, dtype=object);
+        left = self.generated[self.cursor:];
+        count = max(self.block, num - len(left));
+
+        self.generated = left + faces[self.rng.choice(faces.size, count)].tolist();
+        self.cursor = 0;
+
     def draw(self, num=1):
-        return [choice(self.cards) for i in range(num)]; 
+        if self.cursor + num > len(self.generated):
+            self.generate(num);
+
+        chosen = self.generated[self.cursor:self.cursor + num];
+        self.cursor += num;
+
+        return chosen;
+
+    def draw_hidden(self, num=1):
+        '''
+        Draws cards dealt face down (e.g. the dealer's hole card), to be revealed later
+        '''
+        return self.draw(num);
+
+    def reveal(self):
+        '''
+        Turns over the cards dealt face down
+        '''
+        pass;
+
+    def next_hand(self):
+        '''
+        Called by a game before each hand is dealt. An infinite deck needs no shuffling.
+        '''
+        pass;
+
+    def composition(self):
+        '''
+        Returns the probability of drawing each card
+        '''
+        return dict((c, self.cards.count(c) / float(len(self.cards))) for c in set(self.cards));
 
     def __repr__(self):
         return self.size;
@@ -46,20 +145,21 @@ class FullDeck(Deck):
 
     CARDS = [Card.TWO, Card.THREE, Card.FOUR, Card.FIVE, Card.SIX, Card.SEVEN, Card.EIGHT, Card.NINE, Card.KING, Card.QUEEN, Card.JACK, Card.ACE];
 
-    def __init__(self):
+    def __init__(self, seed=None, block=Deck.BLOCK):
         self.cards = dict.fromkeys(FullDeck.CARDS, 4);
         self.size = sum(self.cards.values());
 
-    def draw(self, num=1):
-        cards_left = [c for c in self.cards.keys() if self.cards[c] > 0];
-        chosen = [choice(cards_left) for i in range(num)]; 
-        
-        ''' Uncommenting this, gives a finite 52 card deck
-        for card in chosen:
-            self.cards[c] = self.cards[card] - 1;
-        '''
+        # Cards are never removed (See Shoe for a finite deck), so those left are always the same
+        self.cards_left = [c for c in self.cards.keys() if self.cards[c] > 0];
+        self.block = block;
+        self.prepare(seed);
 
-        return chosen; 
+    def composition(self):
+        '''
+        Returns the probability of drawing each card.
+        Every card left in the deck is as likely as any other
+        '''
+        return dict((c, 1.0 / len(self.cards_left)) for c in self.cards_left);
 
     def __repr__(self):
         return self.cards;
@@ -67,3 +167,137 @@ class FullDeck(Deck):
     def __str__(self):
         return str(self.cards);
 
+
+class Shoe(FullDeck):
+    '''
+    A casino shoe of 1 - 8 standard 52 card decks.
+
+    The shoe is shuffled once and dealt from the top, so every draw simply moves a 
+    cursor along it. A cut card is placed at `penetration` of the way through the shoe,
+    and once it is reached the shoe is reshuffled before the next hand (See next_hand),
+    never during one. Only should the shoe run out mid-hand is it reshuffled then.
+    The number of each card left in the shoe is kept as cards are dealt.
+
+    Watchers (e.g. a card counter, See counting.py) are told of every card
+    dealt and of every shuffle. A card dealt face down is only told of once
+    it is revealed (See draw_hidden).
+    '''
+
+    DECKS = range(1, 9);
+    CARDS = [Card.TWO, Card.THREE, Card.FOUR, Card.FIVE, Card.SIX, Card.SEVEN, Card.EIGHT, Card.NINE, Card.TEN, Card.KING, Card.QUEEN, Card.JACK, Card.ACE];
+    SUITS = 4;
+
+    def __init__(self, decks=6, penetration=0.75, seed=None):
+        if decks not in Shoe.DECKS:
+            raise ValueError('A shoe holds from %d to %d decks' % (Shoe.DECKS[0], Shoe.DECKS[-1]));
+
+        self.decks = decks;
+        self.penetration = penetration;
+        self.shoe = Shoe.CARDS * (Shoe.SUITS * decks);
+        self.cut = int(len(self.shoe) * penetration);
+        self.watchers = [];
+        self.hidden = []; # Cards dealt face down, not yet revealed
+
+        self.prepare(seed);
+
+    def prepare(self, seed=None, block=None):
+        '''
+        Seeds the shoe and shuffles it
+        '''
+        self.rng = generator(seed);
+        self.shuffle();
+
+    def shuffle(self):
+        '''
+        Returns all cards to the shoe and shuffles it
+        '''
+        faces = numpy.array(self.shoe, dtype=object);
+
+        self.shoe = faces[self.rng.permutation(faces.size)].tolist();
+        self.cursor = 0;
+
+        self.cards = dict.fromkeys(Shoe.CARDS, 0);
+        for card in Shoe.CARDS:
+            self.cards[card] += Shoe.SUITS * self.decks;
+
+        self.size = len(self.shoe);
+        self.hidden = [];
+
+        for watcher in self.watchers:
+            watcher.shuffled(self);
+
+    def watch(self, watcher):
+        '''
+        Tells watcher of every card seen dealt or revealed (watcher.dealt(card))
+        and of every shuffle (watcher.shuffled(shoe)) from now on
+        '''
+        self.watchers.append(watcher);
+
+    def dealt(self):
+        '''
+        Returns the number of each card seen dealt since the shoe was shuffled.
+        Cards dealt face down are not seen until revealed.
+        '''
+        dealt = dict.fromkeys(Shoe.CARDS, 0);
+        for card in Shoe.CARDS:
+            dealt[card] += Shoe.SUITS * self.decks;
+
+        for card in self.hidden:
+            dealt[card] -= 1;
+
+        return dict((c, dealt[c] - self.cards[c]) for c in dealt);
+
+    def next_hand(self):
+        '''
+        Reshuffles the shoe between hands, once the cut card is reached
+        '''
+        if self.cursor >= self.cut:
+            self.shuffle();
+
+    def draw(self, num=1):
+        chosen = self.deal(num);
+
+        for card in chosen:
+            for watcher in self.watchers:
+                watcher.dealt(card);
+
+        return chosen;
+
+    def draw_hidden(self, num=1):
+        '''
+        Draws cards face down. Watchers are told of them once revealed (See reveal).
+        '''
+        chosen = self.deal(num);
+        self.hidden.extend(chosen);
+
+        return chosen;
+
+    def reveal(self):
+        for card in self.hidden:
+            for watcher in self.watchers:
+                watcher.dealt(card);
+
+        self.hidden = [];
+
+    def deal(self, num):
+        '''
+        Takes num cards off the top of the shoe
+        '''
+        if self.cursor + num > len(self.shoe):
+            self.shuffle();
+
+        chosen = self.shoe[self.cursor:self.cursor + num];
+        self.cursor += num;
+        self.size -= num;
+
+        for card in chosen:
+            self.cards[card] -= 1;
+
+        return chosen;
+
+    def composition(self):
+        '''
+        Returns the probability of drawing each card
+        from those left in the shoe
+        '''
+        return dict((c, self.cards[c] / float(self.size)) for c in self.cards if self.cards[c] > 0);
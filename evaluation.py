@@ -0,0 +1,180 @@
+'''
+@author: Damola Mabogunje
+@contact: damola@mabogunje.net
+@summary: Measures the expected return of a Blackjack strategy
+'''
+
+import numpy;
+from math import floor, sqrt;
+from multiprocessing import Pool;
+
+from deck import Card, generator;
+from player import Action;
+from blackjack import Blackjack;
+from events import Sink;
+from strategy import Strategy;
+from simulation import BatchGame;
+
+
+class Evaluation(object):
+    '''
+    The expected return of a strategy table (a win pays 1, a loss costs 1)
+    against a dealer playing a fixed policy.
+
+    A table holds the move for each hand against each upcard, indexed by both in
+    half points (See BlackjackPlayer.compile and results.Policy). States missing
+    from it (or marked -1) are stood on.
+
+    The player is dealt two cards and plays out his hand by the table. Should he
+    not bust, the dealer draws his hole card and plays out his hand by his policy.
+    This is the game Strategy solves, so a table it found may be checked here.
+    '''
+
+    CHUNK = 2**20; # Most hands simulated at once
+
+    def __init__(self, table, policy, deck, goal=21):
+        self.table = numpy.asarray(table, dtype=numpy.int8);
+        self.policy = policy;
+        self.deck = deck;
+        self.goal = goal;
+
+        self.strategy = Strategy(policy, deck, goal);
+        self.composition = self.strategy.dealer.composition;
+        self.values = dict(); # (hand, upcard) -> value of playing on by the table
+
+    def action(self, hand, upcard):
+        h, u = int(hand * 2), int(upcard * 2);
+
+        if h < self.table.shape[0] and u < self.table.shape[1] and self.table[h, u] == Action.HIT:
+            return Action.HIT;
+
+        return Action.STAND;
+
+    def value(self, hand, upcard):
+        '''
+        Returns the expected return of playing on from hand by the table
+        '''
+
+        if (hand, upcard) not in self.values:
+            if floor(hand) > self.goal:
+                value = -1.0;
+            elif self.action(hand, upcard) == Action.HIT:
+                value = sum(p * self.value(Card.add(hand, card, self.goal), upcard) for card, p in self.composition);
+            else:
+                value = self.strategy.stand(hand, upcard);
+
+            self.values[(hand, upcard)] = value;
+
+        return self.values[(hand, upcard)];
+
+    def exact(self):
+        '''
+        Returns the exact expected return of a hand, over every deal
+        '''
+
+        total = 0.0;
+
+        for first, p1 in self.composition:
+            for second, p2 in self.composition:
+                hand = Card.add(Card.add(0, first, self.goal), second, self.goal);
+
+                for upcard, p in self.composition:
+                    total += p1 * p2 * p * self.value(hand, upcard);
+
+        return total;
+
+    def simulate(self, hands, seed=None):
+        '''
+        Plays hands at once (in chunks) and returns the sum of their returns,
+        the sum of their squares and the number played
+        '''
+
+        engine = BatchGame(Blackjack(Sink(), self.deck), generator(seed));
+        total, squares = 0.0, 0.0;
+
+        for start in range(0, hands, Evaluation.CHUNK):
+            returns = self.play(engine, min(Evaluation.CHUNK, hands - start));
+
+            total += returns.sum();
+            squares += (returns ** 2).sum();
+
+        return (total, squares, hands);
+
+    def play(self, engine, n, paths=None):
+        '''
+        Plays n hands with the engine's cards (in half points) and returns their returns.
+        Should the engine keep cards of its own for each of many paths (See bankroll.Shoes),
+        paths are those the hands are dealt from.
+        '''
+
+        if paths is None:
+            deal = lambda live: engine.draw(live.size);
+        else:
+            deal = lambda live: engine.draw(paths[live]);
+
+        everyone = numpy.arange(n);
+        zeros = numpy.zeros(n, dtype=numpy.int64);
+        player = engine.add(engine.add(zeros, deal(everyone)), deal(everyone));
+        upcard = deal(everyone);
+        dealer = engine.add(upcard, deal(everyone));
+
+        # The player plays out his hand by the table
+        rows, cols = self.table.shape;
+        live = everyone;
+
+        while live.size:
+            h, u = player[live], upcard[live];
+            known = (h < rows) & (u < cols);
+            hit = known & (self.table[numpy.minimum(h, rows - 1), numpy.minimum(u, cols - 1)] == Action.HIT);
+
+            drawn = live[hit];
+            player[drawn] = engine.add(player[drawn], deal(drawn));
+            live = drawn[player[drawn] // 2 <= self.goal];
+
+        # Then the dealer, should the player not have busted
+        live = numpy.flatnonzero(player // 2 <= self.goal);
+
+        while live.size:
+            hit = self.policy.decide_many(dealer[live] / 2.0) == Action.HIT;
+
+            drawn = live[hit];
+            dealer[drawn] = engine.add(dealer[drawn], deal(drawn));
+            live = drawn[dealer[drawn] // 2 <= self.goal];
+
+        hand, house = player // 2, dealer // 2;
+
+        return numpy.where(hand > self.goal, -1, numpy.where(house > self.goal, 1, numpy.sign(hand - house))).astype(float);
+
+    def monte_carlo(self, hands, workers=1, seed=None, z=1.96):
+        '''
+        Estimates the expected return by playing hands, split between workers.
+        Returns the estimate and the half width of its confidence interval
+        at z standard deviations (95% by default).
+        '''
+
+        shares = [hands // workers + (1 if i < hands % workers else 0) for i in range(workers)];
+        seeds = numpy.random.RandomState(seed).randint(0, 2**31 - 1, workers) if seed is not None else [None] * workers;
+        tasks = [(self.table, self.policy, self.deck, self.goal, share, worker_seed) for share, worker_seed in zip(shares, seeds)];
+
+        if workers > 1:
+            pool = Pool(workers);
+            results = pool.map(simulate, tasks);
+            pool.close();
+        else:
+            results = map(simulate, tasks);
+
+        total, squares, n = [sum(column) for column in zip(*results)];
+        mean = total / n;
+        variance = max(squares / n - mean ** 2, 0.0) * n / max(n - 1, 1);
+
+        return (mean, z * sqrt(variance / n));
+
+
+def simulate(task):
+    '''
+    Plays a share of the hands of a Monte Carlo evaluation in a worker process
+    '''
+
+    table, policy, deck, goal, hands, seed = task;
+
+    return Evaluation(table, policy, deck, goal).simulate(hands, seed);
@@ -0,0 +1,91 @@
+'''
+@author: Damola Mabogunje
+@contact: damola@mabogunje.net
+@summary: Where the events of a game are written
+'''
+
+import sys;
+
+from player import Action;
+
+
+class Sink(object):
+    '''
+    A sink receives the events of every game played:
+    the hands shown, the moves made, and the result.
+
+    This base sink discards them all, so that games
+    may be played silently.
+    '''
+
+    BUFFER = 2**16; # Bytes written to a file at a time
+
+    def __init__(self, out=None):
+        self.out = out;
+
+    @staticmethod
+    def open(kind, path=None):
+        '''
+        Returns a sink of the given kind (See SINKS) writing to the file at path,
+        or to the console if no path is given
+        '''
+        return SINKS[kind](open(path, 'w', Sink.BUFFER) if path else None);
+
+    def hand(self, player):
+        pass;
+
+    def move(self, player, move):
+        pass;
+
+    def result(self, game, plyrA, plyrB, winner):
+        pass;
+
+    def close(self):
+        if self.out and self.out is not sys.stdout:
+            self.out.close();
+
+
+class TextSink(Sink):
+    '''
+    Writes every event as a readable line
+    '''
+
+    def __init__(self, out=None):
+        super(TextSink, self).__init__(out or sys.stdout);
+
+    def hand(self, player):
+        self.out.write("%s's Hand: %s\n" % (player.name, player.cards));
+
+    def move(self, player, move):
+        self.out.write("%s performed '%s'\n" % (player.name, Action.describe(move)));
+
+    def result(self, game, plyrA, plyrB, winner):
+        outcome = "DRAW" if winner is None else game.WINNER % winner.name;
+        self.out.write("%s %s\n" % (game.MATCH % (plyrA.cards, plyrB.cards), outcome));
+
+
+class CsvSink(Sink):
+    '''
+    Writes one record per game:
+
+        [plyrA cards],[plyrB cards],[winner]
+
+    Cards are separated by spaces and the winner is 0 for plyrA,
+    1 for plyrB or -1 for a draw. e.g.
+
+        1 3,2 2,-1
+    '''
+
+    def __init__(self, out=None):
+        super(CsvSink, self).__init__(out or sys.stdout);
+
+    def result(self, game, plyrA, plyrB, winner):
+        outcome = -1 if winner is None else (0 if winner is plyrA else 1);
+
+        self.out.write("%s,%s,%d\n" % (" ".join(map(str, plyrA.cards)), " ".join(map(str, plyrB.cards)), outcome));
+
+
+SINKS = { 'null': Sink,
+          'csv': CsvSink,
+          'text': TextSink
+        };
@@ -0,0 +1,121 @@
+'''
+@author: Damola Mabogunje
+@contact: damola@mabogunje.net
+@summary: Exact probabilities of the hands a dealer finishes on
+'''
+
+import numpy;
+from math import floor;
+
+import player;
+from deck import Card;
+
+
+class DealerOdds(object):
+    '''
+    A dealer playing a fixed policy is an absorbing Markov chain. From each hand total
+    he either stands or busts (both absorbing), or draws a card and moves on to a new total.
+    Hard totals only ever rise and a soft hand can only turn hard once, so the chain has no
+    cycles and its absorption probabilities are found exactly by dynamic programming.
+
+    Outcomes are arrays indexed by the final total in half points (e.g. 17.5 is 35),
+    with the very last index standing for BUST.
+
+    Any policy may be used. It is asked what it would do in each state (See player.Policy),
+    so custom policies need no hand-built table.
+    '''
+
+    TABLES = dict(); # (policy, deck composition, goal) -> DealerOdds
+
+    @staticmethod
+    def get(policy, deck, goal=21):
+        '''
+        Returns the (memoized) odds of a dealer using policy to draw from deck
+        '''
+        composition = tuple(sorted(deck.composition().items()));
+        key = (policy, composition, goal);
+
+        if key not in DealerOdds.TABLES:
+            DealerOdds.TABLES[key] = DealerOdds(policy, composition, goal);
+
+        return DealerOdds.TABLES[key];
+
+    def __init__(self, policy, composition, goal=21):
+        self.policy = policy;
+        self.composition = composition;
+        self.goal = goal;
+
+        self.size = 2 * (goal + 1) + 1; # Every total up to goal.5, and BUST
+        self.BUST = self.size - 1;
+        self.finals = numpy.arange(self.BUST) // 2; # The value of each final total
+
+        self.finished = dict();
+        self.dealt = dict();
+
+    def stands(self, total):
+        return self.policy.decide(total) != player.Action.HIT;
+
+    def finish(self, total):
+        '''
+        Returns the probabilities of each outcome for a dealer holding total
+        '''
+
+        if total not in self.finished:
+            outcome = numpy.zeros(self.size);
+
+            if floor(total) > self.goal:
+                outcome[self.BUST] = 1.0;
+            elif self.stands(total):
+                outcome[int(total * 2)] = 1.0;
+            else:
+                for card, p in self.composition:
+                    outcome += p * self.finish(Card.add(total, card, self.goal));
+
+            self.finished[total] = outcome;
+
+        return self.finished[total];
+
+    def upcard(self, card, hidden=1):
+        '''
+        Returns the probabilities of each outcome for a dealer showing card,
+        who is yet to be dealt `hidden` more cards (e.g. his hole card)
+        '''
+
+        if (card, hidden) not in self.dealt:
+            if hidden == 0:
+                outcome = self.finish(card);
+            else:
+                outcome = numpy.zeros(self.size);
+
+                for c, p in self.composition:
+                    outcome += p * self.upcard(Card.add(card, c, self.goal), hidden - 1);
+
+            self.dealt[(card, hidden)] = outcome;
+
+        return self.dealt[(card, hidden)];
+
+    def beliefs(self, card, hidden=1):
+        '''
+        Returns every total a dealer showing card may yet hold once
+        his `hidden` cards are dealt. Busted hands are all (goal + 1).
+        '''
+
+        totals = set([card]);
+
+        for i in range(hidden):
+            totals = set(Card.add(t, c, self.goal) for t in totals for c, p in self.composition);
+
+        reached = set();
+
+        while totals:
+            total = totals.pop();
+
+            if floor(total) > self.goal:
+                reached.add(self.goal + 1);
+            elif total not in reached:
+                reached.add(total);
+
+                if not self.stands(total):
+                    totals.update(Card.add(total, c, self.goal) for c, p in self.composition);
+
+        return sorted(reached);
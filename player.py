@@ -7,23 +7,10 @@
 import numpy;
 from random import choice;
 from math import floor, ceil;
-from fractions import Fraction;
-from collections import namedtuple;
 
+import odds;
 from deck import Card;
 
-'''
-A policy is a mapping of states to actions. 
-As a namedtuple it works as a wrapper for any function. 
-Allowing us to enforce type-checking for a function 
-as a policy.
-
-Every policy should be uniquely named and used as follows:
-
-    DOUBLE_DOWN = POLICY(function(*args));
-'''
-POLICY = namedtuple('POLICY', 'eval');
-
 
 class Action(object):
     '''
@@ -41,13 +28,112 @@ class Action(object):
 
         return descriptions[move];
 
+
+class Policy(object):
+    '''
+    A policy is a mapping of states to actions.
+
+    It decides the action for a single hand (decide) or for an array of hands
+    at once (decide_many), so that it may be asked what it would do without
+    playing, and drive a batch of games as easily as one.
+    Hands are totals with the ACE at 11.5, so soft hands are marked by their half point.
+
+    threshold is the lowest hand the policy stands on, or None if it never stands.
+    '''
+
+    threshold = None;
+
+    def eval(self, player, deck):
+        '''
+        Plays the player's hand by this policy
+        '''
+        if self.decide(player.hand()) == Action.HIT:
+            return player.draw(1, deck);
+        else:
+            return player.stand();
+
+    def decide(self, hand):
+        raise NotImplementedError('You must implement this method');
+
+    def decide_many(self, hands):
+        return numpy.array([self.decide(hand) for hand in hands], dtype=numpy.int8);
+
+
+class ThresholdPolicy(Policy):
+    '''
+    Hits below the threshold and stands on the rest
+    '''
+
+    def __init__(self, threshold):
+        self.threshold = threshold;
+
+    def decide(self, hand):
+        return Action.HIT if hand < self.threshold else Action.STAND;
+
+    def decide_many(self, hands):
+        return numpy.where(numpy.asarray(hands) < self.threshold, Action.HIT, Action.STAND).astype(numpy.int8);
+
+    def __repr__(self):
+        return "ThresholdPolicy(%s)" % self.threshold;
+
+
+class SoftPolicy(Policy):
+    '''
+    Hits on hard hands below `hard` and on soft hands below `soft`.
+    e.g. A dealer hitting on soft 17 is SoftPolicy(17, 18)
+    '''
+
+    def __init__(self, hard, soft):
+        self.hard = hard;
+        self.soft = soft;
+        self.threshold = min(hard, soft);
+
+    def decide(self, hand):
+        limit = self.soft if hand % 1 else self.hard;
+        return Action.HIT if hand < limit else Action.STAND;
+
+    def decide_many(self, hands):
+        hands = numpy.asarray(hands);
+        limit = numpy.where(hands % 1 != 0, self.soft, self.hard);
+
+        return numpy.where(hands < limit, Action.HIT, Action.STAND).astype(numpy.int8);
+
+    def __repr__(self):
+        return "SoftPolicy(%s, %s)" % (self.hard, self.soft);
+
+
+class TablePolicy(Policy):
+    '''
+    Looks up the action for each hand in a table indexed by the hand in half points
+    (e.g. soft 17, 17.5, is row 35). Hands past the end of the table are stood on.
+    '''
+
+    def __init__(self, table):
+        self.table = numpy.array(list(table) + [Action.STAND], dtype=numpy.int8);
+
+        stands = numpy.flatnonzero(self.table[:-1] == Action.STAND);
+        self.threshold = stands[0] / 2.0 if stands.size else None;
+
+    def decide(self, hand):
+        return int(self.table[min(int(hand * 2), len(self.table) - 1)]);
+
+    def decide_many(self, hands):
+        return self.table[numpy.minimum((numpy.asarray(hands) * 2).astype(numpy.int64), len(self.table) - 1)];
+
+    def __repr__(self):
+        return "TablePolicy(%s)" % self.table[:-1].tolist();
+
+
 class WhitejackPlayer(object):
     '''
     Base class for a player bot
     '''
 
-    def __init__(self, name):
+    __slots__ = ('name', 'goal', 'cards');
+
+    def __init__(self, name, goal=4):
         self.name = name;
+        self.goal = goal;
         self.cards = [];
 
     def draw(self, num, deck):
@@ -70,8 +156,8 @@ class WhitejackPlayer(object):
     def hand(self):
         value = sum(self.cards); 
         
-        if value >= 5: 
-            value = 5;
+        if value >= self.goal + 1: 
+            value = self.goal + 1;
 
         return value;
 
@@ -89,6 +175,8 @@ class DumbPlayer(WhitejackPlayer):
     DumbPlayer always requests a hit
     '''
 
+    __slots__ = ();
+
     def play(self, deck):
         return self.draw(1, deck);
 
@@ -96,21 +184,26 @@ class DumbPlayer(WhitejackPlayer):
 class Learner(DumbPlayer):
     '''
     Learner learns from its matches (Sampling)
+
+    Online, every transition learnt moves the weights of its state towards it
+    by the learning rate (an exponential moving average), so the weights are
+    always current probabilities and need no calculating.
+
+    The best state reachable from each state is kept in an index that is
+    updated whenever a probability of winning changes, so deciding a move
+    is a single lookup.
     '''
 
-    def __init__(self, name="Computer", rate=0.5):
-        super(Learner, self).__init__(name);
+    __slots__ = ('learning_rate', 'online', 'states', 'samples', 'counts', 'weights', 'best');
+
+    def __init__(self, name="Computer", rate=0.5, goal=4, online=False):
+        super(Learner, self).__init__(name, goal);
         self.learning_rate = rate;
+        self.online = online;
 
-        self.states = [ 0,  # START
-                        1,  # STATE 1
-                        2,  # STATE 2
-                        3,  # STATE 3
-                        4,  # STATE 4
-                        5,  # BUST
-                      ];
+        self.states = range(0, goal + 2); # START, STATE 1 ... STATE [goal], BUST
         
-        self.samples = dict.fromkeys(self.states, 0);
+        self.samples = numpy.zeros(len(self.states), dtype=numpy.int64);
 
         '''
         Creates an m X m probability matrix of state transitions 
@@ -118,9 +211,20 @@ class Learner(DumbPlayer):
         and winning in each state.
 
         The probability of winning is the very last value in each row.
+
+        counts holds the number of each transition seen, while weights
+        is the matrix calculate_weights() turns into probabilities.
         '''
 
-        self.weights = dict((s, list([0]*(len(self.states)+1))) for s in self.states);
+        self.counts = numpy.zeros((len(self.states), len(self.states)+1), dtype=numpy.int64);
+        self.weights = numpy.zeros((len(self.states), len(self.states)+1));
+
+        '''
+        best[s] is the state in [s, BUST) with the highest probability of winning,
+        the highest such state on a tie. best[BUST] is None as nothing is accessible.
+        '''
+        self.best = [None] * len(self.states);
+        self.index();
 
     def draw(self, num, deck):
         old = self.hand();
@@ -132,24 +236,19 @@ class Learner(DumbPlayer):
 
     def play(self, deck):
         '''
-        Find accessible states and sort by probability of winning
+        Look up the accessible state with the best probability of winning
         - An accessible state will have a value greater or equal
           to the current state, and less than BUST 
         '''
-        is_accessible = lambda state: (state >= self.hand()) and (state < 5);
-        new_states = filter(is_accessible, self.states);
-        probabilities = [p for p in self.weights.items() if p[0] in new_states];
-
-        probabilities = sorted(probabilities, key=lambda p: p[1][-1]); # Sort by probability of winning
+        hand = self.hand();
+        desired_state = self.best[int(ceil(hand))];
 
         '''
         If there are any better accessible states, try to reach 
         the state with the best chance of winning.
         '''
-        if probabilities:
-            desired_state = probabilities[-1];
-
-            if desired_state[1][-1] > self.weights[self.hand()][-1] and desired_state[0] > self.hand():
+        if desired_state is not None:
+            if self.weights[desired_state, -1] > self.weights[int(hand), -1] and desired_state > hand:
                 action = self.draw(1, deck);
                 self.learn(self.hand() - self.cards[-1], self.hand(), None);
 
@@ -164,47 +263,158 @@ class Learner(DumbPlayer):
         Given a previous state, state and its win/loss result, 
         increase the probability that the old state will result in the current state
         and that the current state may result in a win.
+        Soft hands are learnt as their hard value.
         '''
+        old, curr = int(old), int(curr);
 
         # 1 is Whitejack.WIN
         if result == 1:
-            self.samples[curr] += 1;
-            self.weights[curr][-1] += 1;
+            old, curr = curr, -1;
+
+        self.samples[old] += 1;
+        self.counts[old, curr] += 1;
+
+        if self.online:
+            self.weights[old] *= (1 - self.learning_rate);
+            self.weights[old, curr] += self.learning_rate;
+        else:
+            self.weights[old, curr] += 1;
+
+        # Only a change in the probability of winning moves the best states
+        if self.online or curr == -1:
+            self.index(old);
+
+    def merge(self, samples, counts):
+        '''
+        Adds transition counts collected elsewhere (e.g. by a batch simulation)
+        as though they had been learnt one game at a time.
+
+        Online, the order of the transitions is not known, so each state's weights
+        move towards the transitions seen as far as n moving averages would on average.
+        '''
+
+        self.samples += samples;
+        self.counts += counts;
+
+        if self.online:
+            seen = samples > 0;
+            kept = (1 - self.learning_rate) ** samples[seen][:, numpy.newaxis];
+
+            self.weights[seen] = kept * self.weights[seen] + (1 - kept) * counts[seen] / samples[seen][:, numpy.newaxis].astype(float);
         else:
-            self.samples[old] += 1;
-            self.weights[old][curr] += 1;
+            self.weights += counts;
+
+        self.index();
+
+    def share(self, model):
+        '''
+        Learns into (and plays by) the model of another learner, so that 
+        any number of players may learn as one. The model is shared, not 
+        copied, and is best learnt online so that it is always up to date.
+        '''
+        self.samples, self.counts, self.weights, self.best = model.samples, model.counts, model.weights, model.best;
+
+    def probabilities(self):
+        '''
+        Returns the probability of each transition (and of winning)
+        from each state, calculated from the counts seen so far
+        '''
+        return self.counts / numpy.maximum(self.samples, 1)[:, numpy.newaxis].astype(float);
+
+    def intervals(self, z=1.96):
+        '''
+        Returns the width of the (Wilson score) confidence interval on each
+        probability, at z standard deviations (95% by default).
+        Probabilities of states never seen are infinitely uncertain.
+        '''
+
+        n = self.samples[:, numpy.newaxis].astype(float);
+        p = self.probabilities();
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            width = 2 * z * numpy.sqrt(p * (1 - p) / n + z**2 / (4 * n**2)) / (1 + z**2 / n);
+
+        return numpy.where(n > 0, width, numpy.inf);
+
+    def decisions(self, states=None):
+        '''
+        Returns the action play() would currently take in each state.
+        This is the same comparison play() makes, without drawing a card.
+        States outside of the learnt model are always held.
+        '''
+
+        actions = [];
+
+        for state in (states or self.states):
+            if state not in self.states:
+                actions.append(Action.STAND);
+                continue;
+
+            best = self.best[state];
+            better = best is not None and best > state and self.weights[best, -1] > self.weights[state, -1];
+
+            actions.append(Action.HIT if better else Action.STAND);
+
+        return actions;
+
+    def index(self, state=None):
+        '''
+        Updates the best accessible state from each state up to the given
+        state (only these can reach it), or from every state by default.
+        '''
+
+        bust = self.states[-1];
+        wins = self.weights[:, -1];
+        state = bust - 1 if state is None else min(state, bust - 1);
+
+        best = self.best[state + 1];
+
+        for s in xrange(state, -1, -1):
+            if best is None or wins[s] > wins[best]:
+                best = s;
+
+            self.best[s] = best;
 
     def calculate_weights(self, state=None):
         '''
         Calculates the probability weights of transitions.
         By default, this updates the whole matrix but can
-        be limited to a specific state
+        be limited to a specific state.
+        Online, the weights are always up to date.
         '''
+
+        if self.online:
+            return;
         
         if state is not None and self.samples[state] > 0:
-            self.weights[state] = map(lambda w: Fraction(w, self.samples[state]), self.weights[state]);
+            self.weights[state] /= self.samples[state];
+            self.index(state);
         else:
-            for key in self.states:
-                if self.samples[key] > 0:
-                    self.weights[key] = map(lambda w: Fraction(w, self.samples[key]), self.weights[key]);
+            seen = self.samples > 0;
+            self.weights[seen] /= self.samples[seen][:, numpy.newaxis];
+            self.index();
         
 
 class Dealer(Learner):
     '''
     Although the Dealer learns from his moves, 
-    He may be required to use a fixed policy
+    He may be required to use a fixed policy (See Policy).
+    Without one, he plays by the rules he has learnt.
     '''
 
+    __slots__ = ('policy',);
+
     # Default Dealer Policies.
     POLICIES = { 
-                'DRAW_BELOW_THREE': POLICY(lambda dealer, deck: dealer.draw(1, deck) if dealer.hand() < 3 else dealer.stand()),
-                'DRAW_BELOW_FOUR': POLICY(lambda dealer, deck: dealer.draw(1, deck) if dealer.hand() < 4 else dealer.stand()),
-                'DRAW_BELOW_SEVENTEEN': POLICY(lambda dealer, deck: dealer.draw(1, deck) if dealer.hand() < 17 else dealer.stand())
+                'DRAW_BELOW_THREE': ThresholdPolicy(3),
+                'DRAW_BELOW_FOUR': ThresholdPolicy(4),
+                'DRAW_BELOW_SEVENTEEN': ThresholdPolicy(17),
+                'DRAW_ON_SOFT_SEVENTEEN': SoftPolicy(17, 18)
                };
 
 
-    def __init__(self, name="Dealer", rate=0.5, policy=POLICY(None)):
-        super(Dealer, self).__init__(name, rate);
+    def __init__(self, name="Dealer", rate=0.5, policy=None, goal=4, online=False):
+        super(Dealer, self).__init__(name, rate, goal, online);
         self.policy = policy;
         
     def play(self, deck):
@@ -213,11 +423,22 @@ class Dealer(Learner):
         Otherwise use policy
         '''
 
-        if id(self.policy) not in map(id, Dealer.POLICIES.values()):
+        if self.policy is None:
             return super(Dealer, self).play(deck);
         else:
             return self.policy.eval(self, deck);
 
+    def decisions(self, states=None):
+        '''
+        If we don't have a known policy, report the learnt decisions
+        Otherwise ask the policy what it would do in each state
+        '''
+
+        if self.policy is None:
+            return super(Dealer, self).decisions(states);
+        else:
+            return self.policy.decide_many(states or self.states).tolist();
+
     def upcard(self):
         '''
         First card dealt to dealer is his upcard and thus public
@@ -228,44 +449,20 @@ class Dealer(Learner):
 class BlackjackPlayer(WhitejackPlayer):
     '''
     This player knows the stationary probabilities of reaching terminal states 
-    for certain dealer policies. With this knowledge it can determine what action 
-    to take in any state against a dealer using a known policy.
+    for any dealer policy (See odds.py). With this knowledge it can determine what 
+    action to take in any state against a dealer using a known policy.
+
+    Its moves against a policy and deck are compiled into a table the first time
+    it plays them, so every move after is a lookup. The table is of the deck as it
+    was when compiled; compile() again should its composition change (e.g. a Shoe).
     '''
 
-    # Terminal Stationary Probabilities for dealer policies 
-    P_DEALER = dict();
-    P_DEALER[Dealer.POLICIES['DRAW_BELOW_SEVENTEEN']] = numpy.matrix([[0.13, 0.01, 0.12, 0.01, 0.12, 0.01, 0.10, 0.01, 0.12, 0.40],
-                                                                      [0.12, 0.01, 0.12, 0.01, 0.11, 0.01, 0.11, 0.01, 0.12, 0.42],
-                                                                      [0.10, 0.08, 0.11, 0.00, 0.11, 0.01, 0.10, 0.01, 0.10, 0.43],
-                                                                      [0.37, 0.00, 0.07, 0.08, 0.08, 0.00, 0.08, 0.01, 0.08, 0.27],
-                                                                      [0.14, 0.00, 0.36, 0.00, 0.06, 0.08, 0.07, 0.00, 0.07, 0.25],
-                                                                      [0.13, 0.00, 0.13, 0.00, 0.35, 0.00, 0.05, 0.08, 0.07, 0.24],
-                                                                      [0.12, 0.00, 0.12, 0.00, 0.12, 0.00, 0.34, 0.00, 0.12, 0.22],
-                                                                      [0.12, 0.00, 0.12, 0.00, 0.12, 0.00, 0.12, 0.00, 0.34, 0.22],
-                                                                      [0.11, 0.00, 0.11, 0.00, 0.10, 0.00, 0.10, 0.00, 0.10, 0.48],
-                                                                      [0.05, 0.11, 0.05, 0.10, 0.05, 0.10, 0.05, 0.11, 0.16, 0.24],
-                                                                      [0.10, 0.00, 0.10, 0.00, 0.10, 0.00, 0.10, 0.00, 0.10, 0.52],
-                                                                      [0.05, 0.10, 0.05, 0.10, 0.05, 0.10, 0.05, 0.10, 0.15, 0.27],
-                                                                      [0.09, 0.00, 0.09, 0.00, 0.09, 0.00, 0.09, 0.00, 0.09, 0.55],
-                                                                      [0.05, 0.09, 0.05, 0.09, 0.05, 0.09, 0.05, 0.09, 0.15, 0.30],
-                                                                      [0.09, 0.00, 0.09, 0.00, 0.09, 0.00, 0.09, 0.00, 0.09, 0.58],
-                                                                      [0.06, 0.09, 0.06, 0.09, 0.06, 0.09, 0.06, 0.09, 0.14, 0.33],
-                                                                      [0.08, 0.00, 0.08, 0.00, 0.08, 0.00, 0.08, 0.00, 0.08, 0.61],
-                                                                      [0.06, 0.08, 0.06, 0.08, 0.06, 0.08, 0.06, 0.08, 0.14, 0.35],
-                                                                      [1.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00],
-                                                                      [0.00, 1.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00],
-                                                                      [0.00, 0.00, 1.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00],
-                                                                      [0.00, 0.00, 0.00, 1.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00],
-                                                                      [0.00, 0.00, 0.00, 0.00, 1.00, 0.00, 0.00, 0.00, 0.00, 0.00],
-                                                                      [0.00, 0.00, 0.00, 0.00, 0.00, 1.00, 0.00, 0.00, 0.00, 0.00],
-                                                                      [0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 1.00, 0.00, 0.00, 0.00],
-                                                                      [0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 1.00, 0.00, 0.00],
-                                                                      [0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 1.00, 0.00],
-                                                                      [0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 0.00, 1.00]
-                                                                     ]);
-
-    def __init__(self, name="Computer", rate=0.5):
-        super(BlackjackPlayer, self).__init__(name);
+    __slots__ = ('compiled', 'table');
+
+    def __init__(self, name="Computer", rate=0.5, goal=21):
+        super(BlackjackPlayer, self).__init__(name, goal);
+        self.compiled = None;
+        self.table = None;
 
     def hand(self):
         return sum(self.cards); 
@@ -274,65 +471,73 @@ class BlackjackPlayer(WhitejackPlayer):
         '''
         Returns the minimum hand on which a dealer will stand 
         using policy.
-
-        ::KLUDGE:: Should be a property of the policy
         '''
-        if policy is Dealer.POLICIES['DRAW_BELOW_SEVENTEEN']:
-            return 17;
-
-        return None;
+        return policy.threshold;
 
     def play(self, deck, policy, upcard):
 
-        # Always hit before the dealers lowest possible stand
-        if self.hand() < self.min_hand(policy):
+        if self.compiled != (policy, deck):
+            self.compile(policy, deck);
+
+        hand = min(int(self.hand() * 2), len(self.table) - 1);
+
+        if self.table[hand, int(upcard * 2)] == Action.HIT:
             return self.draw(1, deck);
+        else:
+            return self.stand();
 
+    def compile(self, policy, deck):
+        '''
+        Decides the move in every (hand, upcard) state against policy once, and
+        returns them as a table indexed by hand and upcard in half points
+        (so soft hands and the ACE keep their own rows and column).
+        Hands over the goal share the last row.
         '''
-        We add the least possible additional card to upcard to get the least possible
-        belief state. Then we deduct 4 from this value to get our starting row into the 
-        P_DEALER matrix because state 0,1,2,3 are omitted in our matrix.
 
-        For our starting column, we simply deduct the value of the lowest state the
-        dealer will stand on.
+        upcards = [card for card, p in deck.composition().items()];
+        table = numpy.zeros((2 * (self.goal + 1) + 1, int(max(upcards) * 2) + 1), dtype=numpy.int8);
 
-        ::KLUDGE::
-        ciel() is being used to account for soft states. I valued my ACE at 11.5 instead
-        of 11 so it could access soft states when present in a hand by rounding up.
-        So hand comparison must be done using floor()
-        '''
-        row = ceil(upcard + min(deck.CARDS)) - 4;
-        col = ceil(self.hand() - self.min_hand(policy));
+        for h in range(len(table)):
+            hand = h / 2.0;
 
-        move = self.think(policy, row, col);
+            for upcard in upcards:
+                # Always hit before the dealers lowest possible stand
+                if hand < self.min_hand(policy):
+                    move = Action.HIT;
+                else:
+                    move = self.think(policy, upcard, deck, hand);
 
-        if move is Action.HIT:
-            return self.draw(1, deck);
-        else:
-            return self.stand();
-        
+                table[h, int(upcard * 2)] = move;
 
-    def think(self, policy, row, col):
-        '''
-        Given a dealer policy, and row and column into the transition matrix, 
-        the player determines the best action and returns it.
+        self.compiled = (policy, deck);
+        self.table = table;
+
+        return table;
+
+    def think(self, policy, upcard, deck, hand=None):
         '''
+        Given a dealer policy and his upcard, the player determines the best action and returns it.
+        He thinks about his own hand unless given another.
+
+        The dealer may yet hold any hand reachable from his upcard (our belief states).
+        From each of these we know exactly how likely he is to finish on every total.
 
-        # Get relevant sub-matrix
-        pDealer = BlackjackPlayer.P_DEALER[policy][row:, 0:];
+        ::KLUDGE::
+        I valued my ACE at 11.5 instead of 11 so soft states are marked by their half point.
+        So hand comparison must be done using floor()
+        '''
+        dealer = odds.DealerOdds.get(policy, deck, self.goal);
+        hand = floor(self.hand() if hand is None else hand);
 
-        #print row, col;
-        #print pDealer;
+        # Terminal probabilities from each belief state
+        pDealer = numpy.array([dealer.finish(t) for t in dealer.beliefs(upcard)]);
+        pFinal = pDealer[:, :dealer.BUST];
 
         # Calculate possible outcomes
-        outcomes = numpy.array([[p[0, col:8].sum(), # p(LOSE)
-                                 p[0, col] if (row <= 8 and col < 9)  else p[0, col:col+2].sum(), # p(DRAW)
-                                (p[0, 9] + p[0, 0:col].sum())] # {p(BUST) +  p(WORSE_HAND)} = p(WIN)
-                                for p in pDealer
-                               ]
-                              );
-        numpy.resize(outcomes, (numpy.size(pDealer, 0), 3)); # For readability on print
-        #print outcomes;
+        outcomes = numpy.column_stack([pFinal[:, dealer.finals > hand].sum(1), # p(LOSE)
+                                       pFinal[:, dealer.finals == hand].sum(1), # p(DRAW)
+                                       pDealer[:, dealer.BUST] + pFinal[:, dealer.finals < hand].sum(1) # {p(BUST) +  p(WORSE_HAND)} = p(WIN)
+                                      ]);
 
         expected_outcomes = [max(p) for p in outcomes];
         rewards = [];
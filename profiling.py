@@ -0,0 +1,102 @@
+'''
+@author: Damola Mabogunje
+@contact: damola@mabogunje.net
+@summary: Counts and times the phases of the games
+'''
+
+from functools import wraps;
+from timeit import default_timer as timer;
+
+from blackjack import *;
+from player import *;
+from events import *;
+from simulation import BatchGame;
+
+'''
+The methods timed, and the phase of the game each belongs to.
+
+Methods are only timed once enable() replaces them with timed copies,
+so the games run untouched (and at full speed) otherwise.
+Times are inclusive: a game's time includes its dealing, deciding and so on.
+'''
+PROBES = [(Whitejack, 'play', 'game'),
+          (Whitejack, 'deal', 'dealing'),
+          (Whitejack, 'decide', 'deciding'),
+          (Blackjack, 'decide', 'deciding'),
+          (Whitejack, 'resolve', 'resolving'),
+          (WhitejackPlayer, 'draw', 'drawing'),
+          (Learner, 'learn', 'learning'),
+          (BlackjackPlayer, 'think', 'thinking'),
+          (TextSink, 'hand', 'logging'),
+          (TextSink, 'move', 'logging'),
+          (TextSink, 'result', 'logging'),
+          (CsvSink, 'result', 'logging'),
+          (BatchGame, 'play', 'batch')
+         ];
+
+TIMINGS = dict(); # phase -> [calls, seconds]
+ORIGINALS = dict(); # (class, method) -> untimed method
+
+def enable():
+    '''
+    Starts timing every probed method
+    '''
+
+    for cls, name, phase in PROBES:
+        if (cls, name) not in ORIGINALS:
+            ORIGINALS[(cls, name)] = cls.__dict__[name];
+            setattr(cls, name, timed(cls.__dict__[name], phase));
+
+def disable():
+    '''
+    Puts back the untimed methods. Timings are kept until reset()
+    '''
+
+    for (cls, name), method in ORIGINALS.items():
+        setattr(cls, name, method);
+
+    ORIGINALS.clear();
+
+def enabled():
+    return bool(ORIGINALS);
+
+def reset():
+    for timing in TIMINGS.values():
+        timing[:] = [0, 0.0];
+
+def timed(method, phase):
+    '''
+    Returns a copy of method that adds its calls and time to the phase
+    '''
+
+    timing = TIMINGS.setdefault(phase, [0, 0.0]);
+
+    @wraps(method)
+    def probe(*args, **kwargs):
+        start = timer();
+
+        try:
+            return method(*args, **kwargs);
+        finally:
+            timing[0] += 1;
+            timing[1] += timer() - start;
+
+    return probe;
+
+def stats():
+    '''
+    Returns the number of calls and seconds spent in each phase so far
+    '''
+    return dict((phase, tuple(timing)) for phase, timing in TIMINGS.items() if timing[0]);
+
+def summary():
+    '''
+    Returns the timings as a table, slowest phase first
+    '''
+
+    lines = ["%-10s %10s %12s %14s" % ("PHASE", "CALLS", "SECONDS", "USEC/CALL")];
+
+    for phase, (calls, seconds) in sorted(stats().items(), key=lambda s: -s[1][1]):
+        lines.append("%-10s %10d %12.4f %14.2f" % (phase, calls, seconds, seconds / calls * 1e6));
+
+    return "\n".join(lines);
@@ -0,0 +1,353 @@
+'''
+@author: Damola Mabogunje
+@contact: damola@mabogunje.net
+@summary: Reads results files into memory-mapped columns, and writes them back as text
+'''
+
+import os, re, json;
+import numpy;
+from math import floor;
+from collections import namedtuple;
+
+from blackjack import *;
+from player import Action;
+from deck import Card;
+from events import TextSink;
+
+'''
+A player as the sinks see him: a name and his cards
+'''
+HAND = namedtuple('HAND', 'name cards');
+
+GAMES = dict((game.__name__, game) for game in [Whitejack, Greyjack, Blackjack]);
+
+
+class Columns(object):
+    '''
+    A table held as one numpy array per column. Saved, each column is a
+    .npy file in a directory (with the table's description in meta.json),
+    and opened again as memory-mapped arrays, so only the parts of a column
+    that are read are ever loaded.
+    '''
+
+    COLUMNS = ();
+
+    def __init__(self, columns, meta):
+        self.columns = columns;
+        self.meta = meta;
+
+    def __getattr__(self, name):
+        if name in self.COLUMNS:
+            return self.columns[name];
+
+        raise AttributeError(name);
+
+    def __len__(self):
+        return len(self.columns[self.COLUMNS[0]]);
+
+    def save(self, directory):
+        if not os.path.isdir(directory):
+            os.makedirs(directory);
+
+        for name, column in self.columns.items():
+            numpy.save(os.path.join(directory, name + ".npy"), column);
+
+        with open(os.path.join(directory, "meta.json"), 'w') as out:
+            json.dump(self.meta, out);
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "meta.json")) as meta:
+            meta = json.load(meta);
+
+        columns = dict((name[:-len(".npy")], numpy.load(os.path.join(directory, name), mmap_mode='r'))
+                       for name in os.listdir(directory) if name.endswith(".npy"));
+
+        return cls(columns, meta);
+
+
+class Trace(Columns):
+    '''
+    The games of a trace (as logged by a TextSink or CsvSink), one row per game:
+
+        upcard:  The dealer's first card (his rigged starting state when sampling)
+        hand:    The player's opening hand
+        dealer:  The dealer's final hand
+        player:  The player's final hand
+        outcome: -1 for a draw, 0 if the dealer won or 1 if the player won
+
+    The cards of every game are kept in `cards`, the dealer's then the player's,
+    with game i's starting at offsets[2i] and the player's at offsets[2i + 1].
+
+    Games are indexed by upcard and by outcome: by_upcard (and by_outcome) lists
+    the games sorted by upcard, and upcard_keys/upcard_bounds where each upcard's
+    games begin and end in it.
+    '''
+
+    COLUMNS = ('upcard', 'hand', 'dealer', 'player', 'outcome', 'cards', 'offsets',
+               'by_upcard', 'upcard_keys', 'upcard_bounds', 'by_outcome', 'outcome_keys', 'outcome_bounds');
+
+    RESULT = re.compile(r"^\[(.*)\] versus \[(.*)\] (?:DRAW|(.+) wins!)$");
+    SHOWN = re.compile(r"^(.+)'s Hand: \[");
+    CSV = re.compile(r"^([\d. ]*),([\d. ]*),(-?\d)$");
+
+    @staticmethod
+    def parse(lines, game=Whitejack):
+        '''
+        Reads the games from the lines of a trace, logged as text or csv.
+        Everything but the result of each game (and the players' names) is skipped,
+        as the result holds every card dealt.
+        '''
+
+        names = [];
+        games = [];
+
+        for line in lines:
+            line = line.rstrip("\n");
+
+            if " versus " in line:
+                a, b, winner = Trace.RESULT.match(line).groups();
+                outcome = -1 if winner is None else (0 if names and winner == names[0] else 1);
+
+                games.append((Trace.values(a, ", "), Trace.values(b, ", "), outcome));
+            elif len(names) < 2 and "'s Hand: " in line:
+                name = Trace.SHOWN.match(line).group(1);
+
+                if name not in names:
+                    names.append(name);
+            else:
+                record = Trace.CSV.match(line);
+
+                if record:
+                    a, b, outcome = record.groups();
+                    games.append((Trace.values(a, " "), Trace.values(b, " "), int(outcome)));
+
+        return Trace.build(games, names or ["Dealer", "Learner"], game);
+
+    @staticmethod
+    def values(text, separator):
+        return [float(c) for c in text.split(separator)] if text else [];
+
+    @staticmethod
+    def build(games, names, game=Whitejack):
+        '''
+        Builds (and indexes) the columns of a list of (dealer's cards, player's cards, outcome)
+        '''
+
+        n = len(games);
+        hands = [cards for a, b, outcome in games for cards in (a, b)];
+
+        lengths = numpy.array([len(cards) for cards in hands], dtype=numpy.int64);
+        offsets = numpy.concatenate([[0], numpy.cumsum(lengths)]);
+        cards = numpy.array([c for hand in hands for c in hand], dtype=numpy.float32);
+        totals = numpy.add.reduceat(cards, offsets[:-1]) if cards.size else numpy.zeros(2 * n, dtype=numpy.float32);
+        totals[lengths == 0] = 0;
+
+        columns = { 'upcard': cards[offsets[0:-1:2]] if n else cards,
+                    'hand': numpy.array([sum(b[:game.DEAL]) for a, b, outcome in games], dtype=numpy.float32),
+                    'dealer': totals[0::2],
+                    'player': totals[1::2],
+                    'outcome': numpy.array([outcome for a, b, outcome in games], dtype=numpy.int8),
+                    'cards': cards,
+                    'offsets': offsets
+                  };
+
+        for key in ('upcard', 'outcome'):
+            order = numpy.argsort(columns[key], kind='mergesort');
+            keys, bounds = numpy.unique(columns[key][order], return_index=True);
+
+            columns['by_' + key] = order;
+            columns[key + '_keys'] = keys;
+            columns[key + '_bounds'] = numpy.append(bounds, n);
+
+        return Trace(columns, { 'kind': 'trace', 'names': names, 'game': game.__name__ });
+
+    def indexed(self, key, value):
+        '''
+        Returns the games whose key (upcard or outcome) is value, through its index
+        '''
+
+        keys = self.columns[key + '_keys'];
+        bounds = self.columns[key + '_bounds'];
+        i = numpy.searchsorted(keys, value);
+
+        if i == len(keys) or keys[i] != value:
+            return numpy.zeros(0, dtype=numpy.int64);
+
+        return self.columns['by_' + key][bounds[i]:bounds[i + 1]];
+
+    def select(self, upcard=None, hand=None, outcome=None):
+        '''
+        Returns the rows of the games matching every criterion given
+        '''
+
+        if upcard is not None:
+            rows = self.indexed('upcard', upcard);
+
+            if outcome is not None:
+                rows = rows[self.outcome[rows] == outcome];
+        elif outcome is not None:
+            rows = self.indexed('outcome', outcome);
+        else:
+            rows = numpy.arange(len(self));
+
+        if hand is not None:
+            rows = rows[self.hand[rows] == hand];
+
+        return rows;
+
+    def win_rate(self, upcard=None, hand=None):
+        '''
+        Returns the fraction of the matching games won by the player
+        (and the number of games), e.g. from hand 3 against upcard 1
+        '''
+
+        rows = self.select(upcard, hand);
+        wins = numpy.count_nonzero(self.outcome[rows] == 1);
+
+        return (wins / float(rows.size) if rows.size else float('nan'), rows.size);
+
+    def game(self, i):
+        '''
+        Returns the dealer's cards, the player's cards and the outcome of game i
+        '''
+
+        offsets = self.offsets;
+        cards = [int(c) if c == int(c) else float(c) for c in self.cards[offsets[2 * i]:offsets[2 * i + 2]].tolist()];
+        split = offsets[2 * i + 1] - offsets[2 * i];
+
+        return (cards[:split], cards[split:], int(self.outcome[i]));
+
+    def text(self, out, rows=None):
+        '''
+        Writes the games (or only the given rows) to out as a TextSink logs them.
+
+        The rounds of each game are played back from its cards: both players hit
+        in every round but the last, and the game ended when one stood or busted.
+        Moves are described as the game describes them now.
+        '''
+
+        game = GAMES[self.meta['game']];
+        sink = TextSink(out);
+        names = self.meta['names'];
+        busted = lambda cards: floor(sum(cards)) > game.GOAL;
+
+        for i in (xrange(len(self)) if rows is None else rows):
+            a, b, outcome = self.game(i);
+
+            rounds = max(len(a), len(b)) - game.DEAL;
+
+            if len(a) == len(b) and not (busted(a) or busted(b)):
+                rounds += 1; # Both stood
+
+            for r in range(max(rounds, 1)):
+                for name, cards in zip(names, (a, b)):
+                    sink.hand(HAND(name, cards[:game.DEAL + r]));
+
+                for name, cards in zip(names, (a, b)):
+                    sink.move(HAND(name, cards), Action.HIT if len(cards) > game.DEAL + r else Action.STAND);
+
+            winner = None if outcome < 0 else HAND(names[outcome], None);
+            sink.result(game, HAND(names[0], a), HAND(names[1], b), winner);
+
+
+class Policy(Columns):
+    '''
+    A policy file of `[hand],[upcard]: [action]` lines, one row per line.
+    Soft hands (marked S) are held at their half point, as the ACE is 11.5,
+    and so is an upcard of 11 (the ACE, written without its half point).
+
+    Moves are indexed by `table`, indexed by hand and upcard in half points
+    (See BlackjackPlayer.compile), where hands never listed are -1.
+    '''
+
+    COLUMNS = ('hand', 'upcard', 'action', 'table');
+
+    LINE = re.compile(r"^(S?)(\d+),(\d+): (\w+)$");
+    ACTIONS = { 'hit': Action.HIT, 'hold': Action.STAND };
+
+    @staticmethod
+    def parse(lines):
+        rows = [];
+
+        for line in lines:
+            move = Policy.LINE.match(line.strip());
+
+            if move:
+                soft, hand, upcard, action = move.groups();
+                upcard = Card.ACE if int(upcard) == floor(Card.ACE) else int(upcard);
+                rows.append((int(hand) + (0.5 if soft else 0), upcard, Policy.ACTIONS[action]));
+
+        hand, upcard, action = [numpy.array(column) for column in zip(*rows)] if rows else [numpy.zeros(0)] * 3;
+
+        table = -numpy.ones((int(hand.max() * 2) + 1, int(upcard.max() * 2) + 1) if rows else (0, 0), dtype=numpy.int8);
+        table[(hand * 2).astype(int), (upcard * 2).astype(int)] = action;
+
+        columns = { 'hand': hand.astype(numpy.float32),
+                    'upcard': upcard.astype(numpy.float32),
+                    'action': action.astype(numpy.int8),
+                    'table': table
+                  };
+
+        return Policy(columns, { 'kind': 'policy' });
+
+    def move(self, hand, upcard):
+        '''
+        Returns the move in the state, or None if it is not in the policy
+        '''
+
+        h, u = int(hand * 2), int(upcard * 2);
+
+        if h < self.table.shape[0] and u < self.table.shape[1] and self.table[h, u] >= 0:
+            return int(self.table[h, u]);
+
+        return None;
+
+    def text(self, out, rows=None):
+        '''
+        Writes the policy (or only the given rows) to out as Gambling.py prints it
+        '''
+
+        for i in (xrange(len(self)) if rows is None else rows):
+            hand, upcard = float(self.hand[i]), float(self.upcard[i]);
+
+            out.write("%s%d,%d: %s\n" % ("" if hand == int(hand) else "S", hand, upcard, Action.describe(int(self.action[i]))));
+
+
+KINDS = { 'trace': Trace, 'policy': Policy };
+
+def parse(path, game=Whitejack):
+    '''
+    Reads a results file, telling a policy from a trace by its first line
+    '''
+
+    with open(path) as lines:
+        lines = lines.readlines();
+
+    first = next((line.strip() for line in lines if line.strip()), "");
+
+    if Policy.LINE.match(first):
+        return Policy.parse(lines);
+
+    return Trace.parse(lines, game);
+
+def convert(path, directory=None, game=Whitejack):
+    '''
+    Converts a results file into columns in directory (by default, the file's path
+    with .columns in place of its extension) and returns them memory-mapped
+    '''
+
+    directory = directory or os.path.splitext(path)[0] + ".columns";
+    parse(path, game).save(directory);
+
+    return load(directory);
+
+def load(directory):
+    '''
+    Opens the (memory-mapped) columns of a converted results file
+    '''
+
+    with open(os.path.join(directory, "meta.json")) as meta:
+        kind = json.load(meta)['kind'];
+
+    return KINDS[kind].load(directory);
@@ -0,0 +1,196 @@
+'''
+@author: Damola Mabogunje
+@contact: damola@mabogunje.net
+@summary: Plays many hands of White, Grey or Blackjack at once as numpy arrays
+'''
+
+import numpy;
+from collections import namedtuple;
+
+from deck import *;
+from player import *;
+from blackjack import *;
+
+'''
+The tally of a batch of games.
+
+outcomes: Number of games won by the dealer, drawn, and won by the player
+samples:  2 X m array of state visits for the dealer (row 0) and player (row 1)
+weights:  2 X m X (m+1) array of state transitions for the dealer and player.
+          As with Learner.weights, the very last column counts wins.
+
+samples and weights hold exactly what Learner.learn would have counted
+had the same games been played one at a time.
+'''
+TALLY = namedtuple('TALLY', 'outcomes samples weights');
+
+
+class BatchGame(object):
+    '''
+    Plays a game of Whitejack (or one of its variants) many times over in one go.
+
+    Every hand is a row in an array, so cards are drawn, summed and compared
+    for all live hands at once. Hand totals are held in half points so that
+    the ACE (11.5) can be added exactly. A hand holding an ACE counted at 11.5
+    is soft; should it go over the GOAL, the ACE is counted as 1 instead.
+
+    A dealer with a fixed policy (e.g. Dealer.POLICIES) decides every live hand
+    at once through it, while a Learner plays the decisions it had made in
+    each state when the batch started.
+    '''
+
+    CHUNK = 2**20; # Most hands simulated at once
+
+    def __init__(self, game, seed=None):
+        self.goal = game.GOAL;
+        self.deal = game.DEAL;
+        self.losing = game.GOAL + 1 if isinstance(game, Blackjack) else game.GOAL; # Least hand that loses (See Blackjack.winner)
+        self.states = range(self.goal + 2); # START ... GOAL, BUST
+        self.rng = generator(seed);
+
+        # Cards are drawn with replacement, as likely as they are in the deck when we start
+        composition = sorted(game.deck.composition().items());
+
+        self.cards = numpy.array([int(c * 2) for c, p in composition], dtype=numpy.int64);
+        self.odds = numpy.array([p for c, p in composition]) / sum(p for c, p in composition);
+        self.ace = int(Card.ACE * 2);
+
+    def policy(self, player):
+        '''
+        Returns a function of hand totals (in half points) that is True
+        for the hands on which the player hits
+        '''
+
+        if getattr(player, 'policy', None) is not None:
+            policy = player.policy;
+            return lambda totals: policy.decide_many(numpy.minimum(totals / 2.0, self.goal + 1)) == Action.HIT;
+
+        hits = numpy.array(player.decisions(self.states)) == Action.HIT;
+        return lambda totals: hits[self.state(totals)];
+
+    def play(self, n, plyrA, plyrB, starting_hand=None):
+        '''
+        Plays n games between plyrA (the dealer) and plyrB and tallies them.
+        '''
+
+        m = len(self.states);
+        tally = TALLY(numpy.zeros(3, dtype=numpy.int64),
+                      numpy.zeros((2, m), dtype=numpy.int64),
+                      numpy.zeros((2, m, m+1), dtype=numpy.int64));
+
+        hits = [self.policy(plyrA), self.policy(plyrB)];
+
+        for start in range(0, n, BatchGame.CHUNK):
+            self.play_chunk(min(BatchGame.CHUNK, n - start), hits, starting_hand, tally);
+
+        return tally;
+
+    def play_chunk(self, n, hits, starting_hand, tally):
+
+        totals = numpy.zeros((2, n), dtype=numpy.int64);
+
+        # Deal cards, rigging the dealer's `starting_hand` if provided
+        if starting_hand:
+            totals[0] = self.add(totals[0], numpy.repeat(int(starting_hand * 2), n));
+        else:
+            for i in range(self.deal):
+                totals[0] = self.add(totals[0], self.draw(n));
+
+        for i in range(self.deal):
+            totals[1] = self.add(totals[1], self.draw(n));
+
+        self.learn(tally, 0, numpy.zeros(n, dtype=numpy.int64), self.state(totals[0]));
+        self.learn(tally, 1, numpy.zeros(n, dtype=numpy.int64), self.state(totals[1]));
+
+        live = numpy.arange(n);
+        bust = self.states[-1];
+
+        # Every round removes at least one point from the remaining distance to BUST
+        while live.size:
+            moves = [];
+
+            for p in range(2):
+                old = self.state(totals[p, live]);
+                hit = hits[p](totals[p, live]);
+                drawn = live[hit];
+
+                cards = self.draw(drawn.size);
+                totals[p, drawn] = self.add(totals[p, drawn], cards);
+                new = self.state(totals[p, drawn]);
+
+                self.learn(tally, p, old[hit], new);
+
+                if p == 1:
+                    # Learner.play learns the draw a second time from (hand - last card)
+                    self.learn(tally, p, numpy.clip(new - cards // 2, 0, bust), new);
+
+                moves.append(hit);
+
+            hands = self.state(totals[:, live]);
+            over = ~moves[0] | ~moves[1] | (hands[0] == bust) | (hands[1] == bust);
+
+            self.resolve(tally, hands[:, over]);
+            live = live[~over];
+
+    def resolve(self, tally, hands):
+        '''
+        Decides the winner of finished games as the game's winner() does
+        and lets the winners learn from them
+        '''
+
+        a, b = hands;
+        draw = (a == b);
+        b_wins = ~draw & (a >= self.losing);
+        a_wins = ~draw & ~b_wins & (b >= self.losing);
+        higher = ~draw & ~b_wins & ~a_wins;
+
+        a_wins |= higher & (a > b);
+        b_wins |= higher & (a < b);
+
+        tally.outcomes[0] += a_wins.sum();
+        tally.outcomes[1] += draw.sum();
+        tally.outcomes[2] += b_wins.sum();
+
+        bust = self.states[-1];
+
+        for p, won in enumerate([a_wins, b_wins]):
+            # ::HACK:: Force learning that BUST takes you START, as the game does
+            tally.samples[p, bust] += won.sum();
+            tally.weights[p, bust, 0] += won.sum();
+
+            wins = numpy.bincount(hands[p, won], minlength=len(self.states));
+            tally.samples[p] += wins;
+            tally.weights[p, :, -1] += wins;
+
+    def learn(self, tally, p, old, new):
+        '''
+        Counts the transitions old -> new for player p as Learner.learn would
+        '''
+        m = len(self.states);
+
+        tally.samples[p] += numpy.bincount(old, minlength=m);
+        tally.weights[p] += numpy.bincount(old * (m+1) + new, minlength=m*(m+1)).reshape(m, m+1);
+
+    def draw(self, num):
+        return self.cards[self.rng.choice(self.cards.size, num, p=self.odds)];
+
+    def add(self, totals, cards):
+        '''
+        Adds cards to hand totals (in half points).
+        A second ACE in a soft hand is worth 1, and a soft hand
+        that goes over the GOAL counts its ACE as 1.
+        '''
+
+        soft = (totals % 2 == 1);
+        cards = numpy.where(soft & (cards == self.ace), 2, cards);
+        totals = totals + cards;
+
+        over = (totals // 2 > self.goal) & (totals % 2 == 1);
+
+        return totals - over * (self.ace - 2);
+
+    def state(self, totals):
+        '''
+        Hands are compared on the floor of their value and go no higher than BUST
+        '''
+        return numpy.minimum(totals // 2, self.states[-1]);
@@ -0,0 +1,85 @@
+'''
+@author: Damola Mabogunje
+@contact: damola@mabogunje.net
+@summary: Optimal hit/stand strategy against a dealer with a known policy
+'''
+
+import numpy;
+from math import floor;
+
+from deck import Card;
+from player import Action;
+from odds import DealerOdds;
+
+
+class Strategy(object):
+    '''
+    Finds the expected value of standing and hitting in every (hand, upcard) state
+    by expectimax. Standing is worth p(WIN) - p(LOSE) against the dealer's final totals,
+    while hitting is worth the expected value of the best play in each hand we may draw to.
+
+    Values are memoized by hand, and the dealer's final totals are computed once per
+    upcard (See odds.py), so a whole table is found in one pass.
+    Hands are held with the ACE at 11.5, so soft hands are marked by their half point.
+    '''
+
+    def __init__(self, policy, deck, goal=21):
+        self.dealer = DealerOdds.get(policy, deck, goal);
+        self.goal = goal;
+
+        self.standing = dict(); # upcard -> value of standing on each hand
+        self.values = dict(); # (hand, upcard) -> (value, action)
+
+    def stand(self, hand, upcard):
+        '''
+        Returns the expected value of standing on hand
+        '''
+
+        if floor(hand) > self.goal:
+            return -1.0;
+
+        if upcard not in self.standing:
+            pDealer = self.dealer.upcard(upcard);
+            pFinal = pDealer[:self.dealer.BUST];
+            hands = numpy.arange(self.goal + 1)[:, numpy.newaxis];
+
+            # {p(BUST) + p(WORSE_HAND)} - p(BETTER_HAND), for every hand we could hold
+            self.standing[upcard] = (pDealer[self.dealer.BUST] + (pFinal * (self.dealer.finals < hands)).sum(1)
+                                     - (pFinal * (self.dealer.finals > hands)).sum(1));
+
+        return self.standing[upcard][int(floor(hand))];
+
+    def hit(self, hand, upcard):
+        '''
+        Returns the expected value of hitting on hand, then playing on optimally
+        '''
+        return sum(p * self.value(Card.add(hand, card, self.goal), upcard) for card, p in self.dealer.composition);
+
+    def value(self, hand, upcard):
+        return self.solve(hand, upcard)[0];
+
+    def action(self, hand, upcard):
+        return self.solve(hand, upcard)[1];
+
+    def solve(self, hand, upcard):
+        '''
+        Returns the value of the best action on hand and the action itself
+        '''
+
+        if (hand, upcard) not in self.values:
+            if floor(hand) > self.goal:
+                self.values[(hand, upcard)] = (-1.0, Action.STAND);
+            else:
+                stand = self.stand(hand, upcard);
+                hit = self.hit(hand, upcard);
+
+                self.values[(hand, upcard)] = (hit, Action.HIT) if hit > stand else (stand, Action.STAND);
+
+        return self.values[(hand, upcard)];
+
+    def table(self, hands, upcards):
+        '''
+        Returns the best action for every hand against every upcard
+        as a list of (hand, upcard, action)
+        '''
+        return [(hand, upcard, self.action(hand, upcard)) for hand in hands for upcard in upcards];